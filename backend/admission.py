@@ -0,0 +1,130 @@
+"""
+Admission control and request deadlines
+Separate bounded pools per endpoint class so slow upstream work can't starve cheap routes
+"""
+import asyncio
+import os
+from contextvars import ContextVar
+from typing import Awaitable, Dict, Optional, TypeVar
+
+from fastapi import HTTPException
+
+T = TypeVar("T")
+
+# Absolute deadline (event loop time) of the request being handled; set by AdmissionMiddleware
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+
+class AdmissionRejected(Exception):
+    """The pool is saturated; the request should be shed with a 503"""
+
+    def __init__(self, pool: str, reason: str, retry_after: int):
+        super().__init__(f"{pool}: {reason}")
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class WorkPool:
+    """
+    `concurrency` requests run at once, at most `queue_size` wait, and none
+    waits longer than `queue_timeout` seconds. Admitted requests get a
+    deadline `deadline` seconds out, which upstream calls honour.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float, deadline: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+
+    @classmethod
+    def from_env(cls, name: str, concurrency: int, queue_size: int, queue_timeout: float, deadline: float) -> "WorkPool":
+        prefix = f"ADMISSION_{name.upper()}_"
+        return cls(
+            name,
+            int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+            int(os.getenv(prefix + "QUEUE", str(queue_size))),
+            float(os.getenv(prefix + "QUEUE_TIMEOUT", str(queue_timeout))),
+            float(os.getenv(prefix + "DEADLINE", str(deadline))),
+        )
+
+    async def acquire(self):
+        """Wait for a running slot; raises AdmissionRejected when the queue is full or the wait times out"""
+        if self.waiting >= self.queue_size and self._semaphore.locked():
+            self.shed += 1
+            raise AdmissionRejected(self.name, "queue full", retry_after=max(1, int(self.queue_timeout)))
+
+        self.waiting += 1
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await self._semaphore.acquire()
+        except TimeoutError:
+            self.shed += 1
+            raise AdmissionRejected(self.name, "queue timeout", retry_after=max(1, int(self.queue_timeout)))
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        self.admitted += 1
+
+    def release(self):
+        self.running -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "queue_timeout": self.queue_timeout,
+            "deadline": self.deadline,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+def remaining_seconds(default: Optional[float] = None) -> Optional[float]:
+    """Time left before the current request's deadline (capped at `default`), or `default` outside one"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return default
+    remaining = max(0.0, deadline - asyncio.get_running_loop().time())
+    return remaining if default is None else min(remaining, default)
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    """Await upstream work, cancelling it (and answering 504) once the request's deadline passes"""
+    remaining = remaining_seconds()
+    if remaining is None:
+        return await awaitable
+    try:
+        async with asyncio.timeout(remaining):
+            return await awaitable
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Upstream request exceeded its deadline")
+
+
+class AdmissionController:
+    """Endpoint classes and their pools; see AdmissionMiddleware for how requests are classified"""
+
+    def __init__(self):
+        self.pools: Dict[str, WorkPool] = {
+            "llm": WorkPool.from_env("llm", concurrency=16, queue_size=32, queue_timeout=5, deadline=60),
+            "image": WorkPool.from_env("image", concurrency=4, queue_size=8, queue_timeout=10, deadline=120),
+            "pinterest": WorkPool.from_env("pinterest", concurrency=8, queue_size=32, queue_timeout=5, deadline=60),
+            "crud": WorkPool.from_env("crud", concurrency=256, queue_size=1024, queue_timeout=2, deadline=15),
+        }
+
+    def stats(self) -> Dict:
+        return {name: pool.stats() for name, pool in self.pools.items()}
+
+
+# Singleton instance
+admission = AdmissionController()
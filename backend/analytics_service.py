@@ -0,0 +1,239 @@
+"""
+Materialized dashboard analytics
+Per-user counters kept current with atomic $inc updates on every post write
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+POST_STATUSES = ("draft", "scheduled", "published")
+BACKFILL_ATTEMPTS = 3
+
+
+def _day(timestamp: Optional[str]) -> Optional[str]:
+    """ISO date (YYYY-MM-DD) of an ISO timestamp string"""
+    return timestamp[:10] if timestamp else None
+
+
+def _field_key(value: str) -> str:
+    """Make an arbitrary value (e.g. a board id) safe to use as a Mongo field name"""
+    return str(value).replace(".", "_").replace("$", "_")
+
+
+def post_contribution(post: Dict) -> Dict[str, int]:
+    """Counter increments a single post contributes while it exists in its current state"""
+    counts = {
+        "total_posts": 1,
+        f"status.{post.get('status') or 'draft'}": 1,
+    }
+    if post.get("ai_generated_caption"):
+        counts["ai_generated_caption"] = 1
+    if post.get("ai_generated_image"):
+        counts["ai_generated_image"] = 1
+
+    created_day = _day(post.get("created_at"))
+    if created_day:
+        counts[f"posts_per_day.{created_day}"] = 1
+    published_day = _day(post.get("published_at"))
+    if published_day:
+        counts[f"published_per_day.{published_day}"] = 1
+
+    for board in set(post.get("boards") or []):
+        counts[f"posts_per_board.{_field_key(board)}"] = 1
+
+    # Pins of the post's latest publish, as stored on it
+    pin_count = len([pin_id for pin_id in post.get("pinterest_post_ids") or [] if pin_id])
+    if pin_count:
+        counts["pins_total"] = pin_count
+        if published_day:
+            counts[f"pins_per_day.{published_day}"] = pin_count
+    for board in set(post.get("pinterest_boards_posted") or []):
+        counts[f"pins_per_board.{_field_key(board)}"] = 1
+    return counts
+
+
+def _diff(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    delta = dict(after)
+    for key, value in before.items():
+        delta[key] = delta.get(key, 0) - value
+    return {key: value for key, value in delta.items() if value}
+
+
+class AnalyticsService:
+    """
+    Dashboard counters stored as one document per user in `post_stats`.
+
+    Writes only touch documents that have been initialized; an account's
+    counters are backfilled from `posts` and `posts_archive` by a single
+    aggregation the first time its dashboard is read, and are O(1) to read
+    afterwards. Writes that land while a backfill runs bump its
+    `writes_during_backfill` counter, and the backfill is recomputed rather
+    than stored without them.
+    """
+
+    def __init__(self, stats_collection, posts_collection, archive_collection):
+        self.stats = stats_collection
+        self.posts = posts_collection
+        self.archive = archive_collection
+
+    async def _apply(self, user_id: str, delta: Dict[str, int]):
+        if not delta:
+            return
+        while True:
+            result = await self.stats.update_one(
+                {"_id": user_id, "initialized": True},
+                {"$inc": delta, "$set": {"updated_at": datetime.utcnow().isoformat()}}
+            )
+            if result.matched_count:
+                return
+            result = await self.stats.update_one(
+                {"_id": user_id, "initialized": {"$ne": True}},
+                {"$inc": {"writes_during_backfill": 1}}
+            )
+            if result.matched_count:
+                return
+            if not await self.stats.find_one({"_id": user_id}, {"_id": 1}):
+                return  # Counters not read yet; the first backfill will include this write
+            # Initialized between the two updates: apply the delta to the stored counters
+
+    async def record_created(self, post: Dict):
+        await self._apply(post["user_id"], post_contribution(post))
+
+    async def record_updated(self, before: Dict, after: Dict):
+        await self._apply(after["user_id"], _diff(post_contribution(before), post_contribution(after)))
+
+    async def record_deleted(self, post: Dict):
+        await self._apply(post["user_id"], _diff(post_contribution(post), {}))
+
+    async def record_changes(self, user_id: str, changes: List[Tuple[Optional[Dict], Optional[Dict]]]):
+        """Bulk writes: sum the deltas of many (before, after) pairs into one $inc; None means absent"""
+        delta: Dict[str, int] = {}
+        for before, after in changes:
+            change = _diff(post_contribution(before) if before else {}, post_contribution(after) if after else {})
+            for key, value in change.items():
+                delta[key] = delta.get(key, 0) + value
+        await self._apply(user_id, {key: value for key, value in delta.items() if value})
+
+    async def _backfill(self, user_id: str) -> Dict:
+        """Compute every counter for an account from scratch with one aggregation"""
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {"$unionWith": {"coll": self.archive.name, "pipeline": [{"$match": {"user_id": user_id}}]}},
+            {"$project": {
+                "status": {"$ifNull": ["$status", "draft"]},
+                "ai_generated_caption": 1,
+                "ai_generated_image": 1,
+                "created_day": {"$substrBytes": [{"$ifNull": ["$created_at", ""]}, 0, 10]},
+                "published_day": {"$substrBytes": [{"$ifNull": ["$published_at", ""]}, 0, 10]},
+                "boards": {"$setUnion": [{"$ifNull": ["$boards", []]}]},
+                "pinterest_boards_posted": {"$setUnion": [{"$ifNull": ["$pinterest_boards_posted", []]}]},
+                "pin_count": {"$size": {"$filter": {
+                    "input": {"$ifNull": ["$pinterest_post_ids", []]},
+                    "cond": {"$and": [{"$ne": ["$$this", None]}, {"$ne": ["$$this", ""]}]},
+                }}},
+            }},
+            {"$facet": {
+                "status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+                "ai": [{"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "caption": {"$sum": {"$cond": ["$ai_generated_caption", 1, 0]}},
+                    "image": {"$sum": {"$cond": ["$ai_generated_image", 1, 0]}},
+                    "pins": {"$sum": "$pin_count"},
+                }}],
+                "posts_per_day": [
+                    {"$match": {"created_day": {"$ne": ""}}},
+                    {"$group": {"_id": "$created_day", "count": {"$sum": 1}}},
+                ],
+                "published_per_day": [
+                    {"$match": {"published_day": {"$ne": ""}}},
+                    {"$group": {"_id": "$published_day", "count": {"$sum": 1}}},
+                ],
+                "pins_per_day": [
+                    {"$match": {"published_day": {"$ne": ""}, "pin_count": {"$gt": 0}}},
+                    {"$group": {"_id": "$published_day", "count": {"$sum": "$pin_count"}}},
+                ],
+                "posts_per_board": [
+                    {"$unwind": "$boards"},
+                    {"$group": {"_id": "$boards", "count": {"$sum": 1}}},
+                ],
+                "pins_per_board": [
+                    {"$unwind": "$pinterest_boards_posted"},
+                    {"$group": {"_id": "$pinterest_boards_posted", "count": {"$sum": 1}}},
+                ],
+            }},
+        ]
+        result = (await self.posts.aggregate(pipeline).to_list(1))[0]
+        totals = result["ai"][0] if result["ai"] else {"total": 0, "caption": 0, "image": 0, "pins": 0}
+
+        def as_map(rows):
+            return {_field_key(row["_id"]): row["count"] for row in rows if row["_id"] is not None}
+
+        return {
+            "_id": user_id,
+            "initialized": True,
+            "total_posts": totals["total"],
+            "status": as_map(result["status"]),
+            "ai_generated_caption": totals["caption"],
+            "ai_generated_image": totals["image"],
+            "pins_total": totals["pins"],
+            "posts_per_day": as_map(result["posts_per_day"]),
+            "published_per_day": as_map(result["published_per_day"]),
+            "pins_per_day": as_map(result["pins_per_day"]),
+            "posts_per_board": as_map(result["posts_per_board"]),
+            "pins_per_board": as_map(result["pins_per_board"]),
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+
+    async def _initialize(self, user_id: str) -> Dict:
+        """Backfill and store an account's counters, recomputing if writes landed meanwhile"""
+        stats = None
+        for _ in range(BACKFILL_ATTEMPTS):
+            try:
+                # Marks the backfill as running, so writes from here on bump writes_during_backfill
+                marker = await self.stats.find_one_and_update(
+                    {"_id": user_id},
+                    {"$setOnInsert": {"initialized": False, "writes_during_backfill": 0}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                continue  # Concurrent upsert by another request; read its marker
+            if marker.get("initialized"):
+                return marker  # Another request initialized the counters first; theirs are authoritative
+            stats = await self._backfill(user_id)
+            result = await self.stats.replace_one(
+                {"_id": user_id, "initialized": {"$ne": True}, "writes_during_backfill": marker.get("writes_during_backfill", 0)},
+                stats
+            )
+            if result.matched_count:
+                return stats
+        # Still racing with writes: serve the fresh counts; the next read tries to store them again
+        return stats if stats is not None else await self._backfill(user_id)
+
+    async def get_dashboard(self, user_id: str) -> Dict:
+        stats = await self.stats.find_one({"_id": user_id})
+        if not stats or not stats.get("initialized"):
+            stats = await self._initialize(user_id)
+
+        total = stats.get("total_posts", 0)
+        status_counts = stats.get("status", {})
+        ai_caption = stats.get("ai_generated_caption", 0)
+        ai_image = stats.get("ai_generated_image", 0)
+        return {
+            "total": total,
+            **{status: status_counts.get(status, 0) for status in POST_STATUSES},
+            "ai_generated_caption": ai_caption,
+            "ai_generated_image": ai_image,
+            "ai_caption_ratio": round(ai_caption / total, 4) if total else 0.0,
+            "ai_image_ratio": round(ai_image / total, 4) if total else 0.0,
+            "pins_total": stats.get("pins_total", 0),
+            "posts_per_day": stats.get("posts_per_day", {}),
+            "published_per_day": stats.get("published_per_day", {}),
+            "pins_per_day": stats.get("pins_per_day", {}),
+            "posts_per_board": stats.get("posts_per_board", {}),
+            "pins_per_board": stats.get("pins_per_board", {}),
+            "updated_at": stats.get("updated_at"),
+        }
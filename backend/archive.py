@@ -0,0 +1,357 @@
+"""
+Hot/archive tiering for published posts
+Moves old published posts from `posts` to `posts_archive`, keeping their inline images in a content-addressed blob collection
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from bson import Binary
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() != "false"
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))  # Age since publishing
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+ARCHIVE_LEASE_SECONDS = 600  # Minimum lease; a worker that dies holding it is replaced after this long
+
+INLINE_IMAGE_FIELDS = ("image_url", "image_data")
+
+
+def _split_inline_image(value) -> Optional[tuple]:
+    """(prefix, raw bytes) of an inline base64 image field value, or None for hosted URLs and garbage"""
+    if not isinstance(value, str) or not value:
+        return None
+    prefix, payload = "", value
+    if value.startswith("data:"):
+        head, _, payload = value.partition(",")
+        if not head.endswith(";base64"):
+            return None
+        prefix = head + ","
+    elif value.startswith(("http://", "https://", "/")):
+        return None
+    try:
+        data = binascii.a2b_base64(payload, strict_mode=True)
+    except (binascii.Error, ValueError):
+        return None
+    # Only values _restore_images reproduces exactly (no whitespace, canonical padding) are stored as blobs
+    if binascii.b2a_base64(data, newline=False).decode("ascii") != payload:
+        return None
+    return prefix, data
+
+
+class BlobStore:
+    """
+    Raw image bytes stored once per content hash in a Mongo collection, with a reference count.
+
+    Storing the decoded bytes drops base64's 33% overhead; identical images
+    shared by several archived posts are kept once. Every host and worker
+    sees the same blobs. A blob is only deleted by a conditional delete on
+    `refs <= 0`, so a concurrent `put` of the same image always wins.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    async def put(self, digest: str, data: bytes):
+        """Add one reference to a blob, storing its bytes if it is new"""
+        update = {"$inc": {"refs": 1}, "$setOnInsert": {"data": Binary(data), "bytes": len(data)}}
+        try:
+            await self.collection.update_one({"_id": digest}, update, upsert=True)
+        except DuplicateKeyError:
+            # Inserted concurrently by another upsert; it exists now, so this one increments it
+            await self.collection.update_one({"_id": digest}, update, upsert=True)
+
+    async def get_many(self, digests: List[str]) -> Dict[str, bytes]:
+        if not digests:
+            return {}
+        return {
+            blob["_id"]: bytes(blob["data"])
+            async for blob in self.collection.find({"_id": {"$in": list(set(digests))}}, {"data": 1})
+        }
+
+    async def release(self, digests: List[str]):
+        """Drop one reference per digest (repeat a digest to drop several); blobs left unreferenced are deleted"""
+        for digest in digests:
+            blob = await self.collection.find_one_and_update(
+                {"_id": digest},
+                {"$inc": {"refs": -1}},
+                projection={"refs": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if blob is not None and blob["refs"] <= 0:
+                await self.collection.delete_one({"_id": digest, "refs": {"$lte": 0}})
+
+
+class PostArchive:
+    """
+    Cold storage for published posts.
+
+    A background job moves posts published more than ARCHIVE_AFTER_DAYS ago
+    from `posts` to `posts_archive` in batches. Inline images are written to
+    the blob store and replaced by references in `archived_images`, so archived
+    documents stay small; each archived post holds one reference to each
+    digest in its `image_blobs`. A post is only removed from `posts` if it is
+    unchanged since it was copied; one edited mid-batch stays hot.
+
+    Archived posts are read back through `find` (images restored), moved back
+    to `posts` by `unarchive` when they are edited or republished, and removed
+    by `delete`/`delete_many`. Analytics counters, duplicate signatures and
+    stored thumbnails are kept across the move.
+    """
+
+    def __init__(self, posts_collection, archive_collection, leases_collection, blobs_collection):
+        self.posts = posts_collection
+        self.archive = archive_collection
+        self.leases = leases_collection
+        self.blobs = BlobStore(blobs_collection)
+        self.enabled = ARCHIVE_ENABLED
+        self.after_days = ARCHIVE_AFTER_DAYS
+        self.interval = ARCHIVE_INTERVAL_SECONDS
+        self.batch_size = ARCHIVE_BATCH_SIZE
+        self._holder = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+        self.archived = 0
+        self.last_run: Optional[str] = None
+
+    async def ensure_indexes(self):
+        await self.posts.create_index([("status", 1), ("published_at", 1)])
+        await self.archive.create_index([("user_id", 1), ("created_at", -1)])
+
+    # Images
+
+    def _strip_images(self, post: Dict) -> Tuple[Dict, Dict[str, bytes]]:
+        """Archived copy of a post with inline images replaced by references, and the referenced bytes by digest"""
+        archived = dict(post)
+        references, blobs = {}, {}
+        for field in INLINE_IMAGE_FIELDS:
+            inline = _split_inline_image(post.get(field))
+            if inline is None:
+                continue
+            prefix, data = inline
+            digest = BlobStore.digest(data)
+            blobs[digest] = data
+            references[field] = {"blob": digest, "prefix": prefix, "bytes": len(data)}
+            archived[field] = None
+        if references:
+            archived["archived_images"] = references
+            archived["image_blobs"] = sorted(blobs)
+        archived["archived_at"] = datetime.utcnow().isoformat()
+        return archived, blobs
+
+    def _restore_images(self, post: Dict, blobs: Dict[str, bytes]) -> Dict:
+        """Inverse of _strip_images: the post as it was stored in `posts`"""
+        references = post.pop("archived_images", None) or {}
+        post.pop("image_blobs", None)
+        post.pop("archived_at", None)
+        for field, reference in references.items():
+            data = blobs.get(reference["blob"])
+            if data is None:
+                logger.warning("Archived image %s of post %s is missing", reference["blob"], post.get("_id"))
+                continue
+            post[field] = reference["prefix"] + base64.b64encode(data).decode("ascii")
+        return post
+
+    async def restore_images(self, post: Dict) -> Dict:
+        references = post.get("archived_images")
+        if not references:
+            return self._restore_images(post, {})
+        blobs = await self.blobs.get_many([reference["blob"] for reference in references.values()])
+        return await asyncio.to_thread(self._restore_images, post, blobs)
+
+    async def _remove_archived(self, query: Dict) -> Optional[Dict]:
+        """Delete one archived post and release its blob references; returns it, or None if already gone"""
+        post = await self.archive.find_one_and_delete(query, projection={"archived_images": 0})
+        if post is not None:
+            await self.blobs.release(post.get("image_blobs", []))
+        return post
+
+    # Archival job
+
+    async def archive_batch(self, cutoff: str) -> List[Dict]:
+        """Archive up to batch_size posts published before `cutoff`; returns the moved posts (_id, user_id)"""
+        posts = await self.posts.find(
+            {"status": "published", "published_at": {"$lt": cutoff}}
+        ).sort("published_at", 1).limit(self.batch_size).to_list(self.batch_size)
+        if not posts:
+            return []
+
+        stripped = await asyncio.to_thread(lambda: [self._strip_images(post) for post in posts])
+        for _, blobs in stripped:
+            for digest, data in blobs.items():
+                await self.blobs.put(digest, data)
+        # A copy left by an interrupted earlier run is replaced; its blob references are released
+        replaced = await asyncio.gather(*(
+            self.archive.find_one_and_replace(
+                {"_id": archived["_id"]}, archived, projection={"image_blobs": 1}, upsert=True
+            )
+            for archived, _ in stripped
+        ))
+        await self.blobs.release([digest for previous in replaced if previous for digest in previous.get("image_blobs", [])])
+        # Only remove posts nobody changed since they were read
+        results = await asyncio.gather(*(
+            self.posts.delete_one({
+                "_id": post["_id"],
+                "updated_at": post.get("updated_at"),
+                "published_at": post.get("published_at"),
+                "thumbnail_version": post.get("thumbnail_version"),
+            })
+            for post in posts
+        ))
+
+        # No match means the post was edited (still hot) or deleted by its owner since it was
+        # read; either way the archive copy must go, or it would shadow the edit or resurrect the post
+        not_moved = {post["_id"] for post, result in zip(posts, results) if result.deleted_count == 0}
+        for post_id in not_moved:
+            await self._remove_archived({"_id": post_id})
+        return [{"_id": post["_id"], "user_id": post["user_id"]} for post in posts if post["_id"] not in not_moved]
+
+    async def archive_due(self, on_archived: Optional[Callable[[List[Dict]], None]] = None) -> int:
+        """Archive every post that is due, batch by batch"""
+        cutoff = (datetime.utcnow() - timedelta(days=self.after_days)).isoformat()
+        total = 0
+        while True:
+            moved = await self.archive_batch(cutoff)
+            if not moved:
+                break  # Nothing due, or everything left was edited mid-batch (retried next run)
+            total += len(moved)
+            if on_archived is not None:
+                on_archived(moved)
+        self.archived += total
+        self.last_run = datetime.utcnow().isoformat()
+        return total
+
+    async def _acquire_lease(self) -> bool:
+        now = datetime.utcnow()
+        # Held for a whole interval so the job runs once per interval however many workers there are
+        lease_seconds = max(self.interval, ARCHIVE_LEASE_SECONDS)
+        lease = {"holder": self._holder, "expires_at": now + timedelta(seconds=lease_seconds)}
+        try:
+            await self.leases.update_one(
+                {"_id": "post_archive", "$or": [{"holder": self._holder}, {"expires_at": {"$lt": now}}]},
+                {"$set": lease},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False  # Held by another worker
+
+    async def _run(self, on_archived: Optional[Callable[[List[Dict]], None]]):
+        while True:
+            try:
+                if await self._acquire_lease():
+                    archived = await self.archive_due(on_archived)
+                    if archived:
+                        logger.info("Archived %d published posts older than %d days", archived, self.after_days)
+            except PyMongoError as error:
+                logger.warning("Post archival failed, retrying next run: %s", error)
+            except Exception:
+                # Anything else (e.g. a blob too large for a document) must not end the job for good
+                logger.exception("Post archival failed unexpectedly, retrying next run")
+            await asyncio.sleep(self.interval)
+
+    def start(self, on_archived: Optional[Callable[[List[Dict]], None]] = None):
+        """Run the archival job every `interval` seconds; `on_archived` receives the moved posts (_id, user_id)"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run(on_archived))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # Reads and writes of archived posts
+
+    async def find(self, post_id: str, user_id: Optional[str], projection: Optional[Dict] = None) -> Optional[Dict]:
+        """An archived post with its images restored; user_id None skips the owner check (signed thumbnail URLs)"""
+        query = {"_id": post_id} if user_id is None else {"_id": post_id, "user_id": user_id}
+        post = await self.archive.find_one(query, projection)
+        return await self.restore_images(post) if post else None
+
+    async def iter_restored(self, cursor) -> AsyncIterator[Dict]:
+        """Archived posts from `cursor` with their images restored; closes the cursor when done"""
+        try:
+            async for post in cursor:
+                yield await self.restore_images(post)
+        finally:
+            await cursor.close()
+
+    async def unarchive(self, post_id: str, user_id: str) -> Optional[Dict]:
+        """Move an archived post back into `posts` (for edits and republishing); returns it or None"""
+        post = await self.archive.find_one({"_id": post_id, "user_id": user_id})
+        if not post:
+            return None
+        restored = await self.restore_images(post)
+        try:
+            await self.posts.insert_one(restored)
+        except DuplicateKeyError:
+            pass  # Restored concurrently
+        # Only the request whose delete removes the archived copy releases its blobs
+        await self._remove_archived({"_id": post_id})
+        return await self.posts.find_one({"_id": post_id})
+
+    async def delete(self, post_id: str, user_id: str) -> Optional[Dict]:
+        """Delete an archived post; returns it (without images) or None"""
+        return await self._remove_archived({"_id": post_id, "user_id": user_id})
+
+    async def delete_many(self, post_ids: List[str], user_id: str) -> List[Dict]:
+        """Delete archived posts by id; returns the ones that existed (without images)"""
+        if not post_ids:
+            return []
+        removed = [await self._remove_archived({"_id": post_id, "user_id": user_id}) for post_id in set(post_ids)]
+        return [post for post in removed if post is not None]
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "after_days": self.after_days,
+            "interval_seconds": self.interval,
+            "archived_since_start": self.archived,
+            "last_run": self.last_run,
+            "blob_collection": self.blobs.collection.name,
+        }
+
+
+class MergedCursor:
+    """
+    Several cursors that are each sorted ascending by `key`, read as one
+    sorted stream. Sources can be Motor cursors or async generators; `close`
+    closes all of them.
+    """
+
+    def __init__(self, key: str, *sources):
+        self.key = key
+        self.sources = sources
+
+    async def __aiter__(self):
+        iterators = [source.__aiter__() for source in self.sources]
+        heads = [await anext(iterator, None) for iterator in iterators]
+        while True:
+            candidates = [(head.get(self.key) or "", position) for position, head in enumerate(heads) if head is not None]
+            if not candidates:
+                return
+            _, position = min(candidates)
+            yield heads[position]
+            heads[position] = await anext(iterators[position], None)
+
+    async def close(self):
+        for source in self.sources:
+            close = getattr(source, "aclose", None) or source.close
+            await close()
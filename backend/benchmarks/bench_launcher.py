@@ -0,0 +1,149 @@
+"""
+Server launch benchmark
+Requests/sec of the previous single-process uvicorn setup versus the production launcher settings
+
+Each configuration runs as a real uvicorn server on a local port, serving
+the middleware stack from bench_middleware.py (no database). Load comes from
+separate client processes over raw keep-alive connections, so the numbers include
+the HTTP parser and event loop. Multi-worker results only mean something with
+spare cores for both the workers and the load generators.
+
+Run from the backend directory:
+    python benchmarks/bench_launcher.py [--workers N] [--seconds S] [--concurrency C]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from launcher import uvicorn_options  # noqa: E402
+
+CLIENT_PROCESSES = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+# Imported by the uvicorn workers as bench_launcher:app
+if __name__ != "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_middleware import after_app
+    app = after_app()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+SERVER_SCRIPT = """
+import sys, uvicorn
+sys.path[:0] = {paths!r}
+uvicorn.run("bench_launcher:app", **{options!r})
+"""
+
+
+def start_server(options: dict) -> subprocess.Popen:
+    script = SERVER_SCRIPT.format(paths=[os.path.dirname(os.path.abspath(__file__)), BACKEND_DIR], options=options)
+    return subprocess.Popen([sys.executable, "-c", script], cwd=BACKEND_DIR)
+
+
+def wait_until_up(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+async def drive(port: int, path: str, seconds: float, concurrency: int) -> int:
+    """Keep-alive GET loop on `concurrency` raw connections; far cheaper per request than an HTTP client library"""
+    request = f"GET {path} HTTP/1.1\r\nHost: bench\r\nAccept: application/json\r\n\r\n".encode("ascii")
+    stop_at = time.monotonic() + seconds
+
+    async def connection() -> int:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        completed = 0
+        try:
+            while time.monotonic() < stop_at:
+                writer.write(request)
+                head = await reader.readuntil(b"\r\n\r\n")
+                if not head.startswith(b"HTTP/1.1 200"):
+                    raise RuntimeError(head.split(b"\r\n", 1)[0].decode())
+                length = 0
+                for line in head.split(b"\r\n"):
+                    name, _, value = line.partition(b":")
+                    if name.lower() == b"content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+                completed += 1
+        finally:
+            writer.close()
+        return completed
+
+    return sum(await asyncio.gather(*(connection() for _ in range(concurrency))))
+
+
+def client_process(port: int, path: str, seconds: float, concurrency: int, results):
+    results.put(asyncio.run(drive(port, path, seconds, concurrency)))
+
+
+def measure(port: int, path: str, seconds: float, concurrency: int) -> float:
+    asyncio.run(drive(port, path, 1, concurrency))  # Warm up
+    results = multiprocessing.Queue()
+    clients = [
+        multiprocessing.Process(target=client_process, args=(port, path, seconds, concurrency // CLIENT_PROCESSES or 1, results))
+        for _ in range(CLIENT_PROCESSES)
+    ]
+    for client in clients:
+        client.start()
+    total = sum(results.get() for _ in clients)
+    for client in clients:
+        client.join()
+    return total / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    os.environ.setdefault("WEB_CONCURRENCY", str(args.workers))
+    os.environ.setdefault("ACCESS_LOG", "false")
+    production = uvicorn_options()
+    configurations = {
+        # What `python server.py` used to run: uvicorn.run(app, host=..., port=...)
+        "single process (before)": {
+            "host": "127.0.0.1", "log_level": "warning", "access_log": False, "loop": "asyncio", "http": "h11"
+        },
+        f"launcher, {production['workers']} worker(s), {production['loop']}/{production['http']}": {
+            **production, "host": "127.0.0.1", "log_level": "warning"
+        },
+    }
+
+    print(f"{CLIENT_PROCESSES} client process(es), {args.concurrency} concurrent requests, {args.seconds:.0f} s per run")
+    print(f"{'configuration':<44} {'route':<12} {'req/s':>9}")
+    for name, options in configurations.items():
+        port = free_port()
+        server = start_server({**options, "port": port})
+        try:
+            wait_until_up(port)
+            for path in ("/", "/api/posts"):
+                print(f"{name:<44} {path:<12} {measure(port, path, args.seconds, args.concurrency):>9.0f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
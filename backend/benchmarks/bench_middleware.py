@@ -0,0 +1,182 @@
+"""
+Middleware overhead benchmark
+Per-request cost of the old @app.middleware("http") rate limiter versus the pure ASGI stack
+
+Requests are driven straight through the ASGI interface (no sockets, no
+database), so the numbers are the framework + middleware cost alone. `/api/posts`
+returns a static 100-post listing page.
+
+Run from the backend directory:
+    python benchmarks/bench_middleware.py
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime
+
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from admission import AdmissionController  # noqa: E402
+from middleware import AdmissionMiddleware, CompressionMiddleware, RateLimitMiddleware, RequestContextMiddleware  # noqa: E402
+
+REQUESTS = 2000
+ROUNDS = 5
+EXCLUDE_PATHS = ["/", "/docs", "/openapi.json", "/api/pinterest/mode"]
+UNLIMITED = 10 ** 9  # Measure the limiter's bookkeeping, never its 429 path
+ADMISSION_CLASSES = [  # As in server.py
+    ("/api/ai/generate-image", "image"),
+    ("/api/ai/", "llm"),
+    ("/api/pinterest/post/", "pinterest"),
+    ("/api/pinterest/boards", "pinterest"),
+    ("/api/pinterest/callback", "pinterest"),
+]
+
+
+def make_listing(size: int = 100) -> dict:
+    user_id = str(uuid.uuid4())
+    return {"posts": [
+        {
+            "_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "title": "Quick 5-Minute Breakfast Ideas",
+            "caption": "Mornings just got easier! Try these game-changing breakfast hacks",
+            "description": "Discover 5 delicious breakfast recipes that take only 5 minutes to prepare.",
+            "image_url": None,
+            "boards": ["mock_board_1"],
+            "tagged_topics": ["breakfast", "quick recipes"],
+            "status": "draft",
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        for _ in range(size)
+    ]}
+
+
+LISTING = make_listing()
+
+
+def make_app() -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+
+    @app.get("/")
+    async def root():
+        return {"message": "Pinspire API is running", "status": "healthy"}
+
+    @app.get("/api/posts")
+    async def get_posts():
+        return ORJSONResponse(LISTING)
+
+    return app
+
+
+def add_cors_and_compression(app: FastAPI):
+    app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+
+def before_app() -> FastAPI:
+    """The previous stack: BaseHTTPMiddleware rate limiter (as it was in server.py) + CORS + compression"""
+    app = make_app()
+    request_tracker = defaultdict(lambda: deque(maxlen=500))
+
+    async def rate_limit_check(request):
+        if request.url.path in EXCLUDE_PATHS:
+            return
+        client_ip = request.client.host
+        current_time = time.time()
+        while request_tracker[client_ip] and request_tracker[client_ip][0] < current_time - 60:
+            request_tracker[client_ip].popleft()
+        if len(request_tracker[client_ip]) >= UNLIMITED:
+            raise HTTPException(status_code=429, detail="Rate limit exceeded")
+        request_tracker[client_ip].append(current_time)
+
+    @app.middleware("http")
+    async def rate_limiting_middleware(request, call_next):
+        try:
+            await rate_limit_check(request)
+            return await call_next(request)
+        except HTTPException as e:
+            return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+
+    add_cors_and_compression(app)
+    return app
+
+
+def after_app() -> FastAPI:
+    """The current stack from server.py, in its order"""
+    app = make_app()
+    app.add_middleware(
+        AdmissionMiddleware,
+        controller=AdmissionController(),
+        classes=ADMISSION_CLASSES,
+        default_pool="crud",
+        exclude_paths=["/api/events/posts"]
+    )
+    app.add_middleware(RateLimitMiddleware, max_requests=UNLIMITED, window_seconds=60, exclude_paths=EXCLUDE_PATHS)
+    add_cors_and_compression(app)
+    app.add_middleware(RequestContextMiddleware)
+    return app
+
+
+async def call(app, path: str):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("ascii"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"accept", b"application/json")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()  # Block like a client that stays connected
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def measure(app, path: str) -> float:
+    """Median microseconds per request over ROUNDS rounds"""
+    for _ in range(100):  # Warm up (builds the middleware stack)
+        await call(app, path)
+    rounds = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for _ in range(REQUESTS):
+            await call(app, path)
+        rounds.append((time.perf_counter() - start) / REQUESTS * 1e6)
+    return statistics.median(rounds)
+
+
+async def main():
+    apps = {"bare": make_app(), "before": before_app(), "after": after_app()}
+    print(f"{'route':<12} {'bare us':>9} {'before us':>10} {'after us':>9} {'overhead before':>16} {'overhead after':>15}")
+    for path in ("/", "/api/posts"):
+        timings = {name: await measure(app, path) for name, app in apps.items()}
+        print(
+            f"{path:<12} {timings['bare']:>9.1f} {timings['before']:>10.1f} {timings['after']:>9.1f} "
+            f"{timings['before'] - timings['bare']:>16.1f} {timings['after'] - timings['bare']:>15.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Serialization benchmark for post listing responses
+Compares FastAPI's default path (jsonable_encoder + json.dumps) against orjson
+
+Run from the backend directory:
+    python benchmarks/bench_serialization.py
+"""
+import base64
+import json
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+PAGE_SIZES = [100, 1000]
+REPEATS = 5
+IMAGE_BYTES = 48 * 1024  # Typical inline thumbnail-sized payload per post
+
+
+def make_post(user_id: str, image_data: str) -> dict:
+    """Build a post document shaped like the ones stored by create_post"""
+    return {
+        "_id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "title": "Quick 5-Minute Breakfast Ideas",
+        "caption": "Mornings just got easier! Try these game-changing breakfast hacks",
+        "description": "Discover 5 delicious breakfast recipes that take only 5 minutes to prepare. " * 4,
+        "link_url": "https://example.com/breakfast",
+        "image_url": None,
+        "image_data": image_data,
+        "boards": ["mock_board_1", "mock_board_2"],
+        "suggested_boards": ["Quick Recipes", "Breakfast Ideas", "Healthy Eating"],
+        "tagged_topics": ["breakfast", "quick recipes", "healthy eating", "meal prep", "morning routine"],
+        "scheduled_time": None,
+        "status": "draft",
+        "ai_generated_caption": True,
+        "ai_generated_image": True,
+        "pinterest_post_id": None,
+        "created_at": datetime.utcnow().isoformat(),
+        "published_at": None,
+        "metadata": {},
+    }
+
+
+def default_path(content: dict) -> bytes:
+    """What FastAPI does for a plain dict return value with JSONResponse"""
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def orjson_path(content: dict) -> bytes:
+    """What fast_json() does: hand the documents straight to orjson"""
+    return orjson.dumps(content)
+
+
+def measure(fn, content: dict) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(content)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    user_id = str(uuid.uuid4())
+    image_data = base64.b64encode(os.urandom(IMAGE_BYTES)).decode("ascii")
+
+    print(f"{'posts':>6} {'payload MB':>11} {'default ms':>11} {'orjson ms':>10} {'speedup':>8}")
+    for size in PAGE_SIZES:
+        content = {"posts": [make_post(user_id, image_data) for _ in range(size)]}
+        payload_mb = len(orjson_path(content)) / (1024 * 1024)
+        default_ms = measure(default_path, content)
+        orjson_ms = measure(orjson_path, content)
+        print(f"{size:>6} {payload_mb:>11.1f} {default_ms:>11.2f} {orjson_ms:>10.2f} {default_ms / orjson_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Near-duplicate post detection
+MinHash signatures with LSH banding, stored in Mongo next to the posts they describe
+"""
+import hashlib
+import random
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+from pymongo import DeleteOne, ReplaceOne
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS  # 4 rows/band: ~50% Jaccard has ~50% chance to collide in some band
+DEFAULT_SIMILARITY_THRESHOLD = 0.6
+MAX_CANDIDATES = 200
+BACKFILL_BATCH_SIZE = 500
+
+# Universal hashing h(x) = (a*x + b) mod p on 32-bit values: every intermediate fits in uint64,
+# so signatures are computed exactly with vectorized numpy arithmetic
+_PRIME = 4294967291  # Largest prime below 2**32
+_rng = random.Random(20240501)  # Fixed seed: signatures must be stable across processes and restarts
+_PERM_A = np.array([_rng.randrange(1, _PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+_PERM_B = np.array([_rng.randrange(0, _PRIME) for _ in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+SIGNATURE_FIELDS = {"user_id": 1, "caption": 1, "description": 1, "tagged_topics": 1}
+
+
+def shingles(post: Dict) -> set:
+    """Word unigrams and bigrams of caption + description, plus tagged topics"""
+    text = f"{post.get('caption') or ''} {post.get('description') or ''}".lower()
+    words = _TOKEN.findall(text)
+    result = set(words)
+    result.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+    result.update(f"topic:{topic.strip().lower()}" for topic in post.get("tagged_topics") or [] if isinstance(topic, str))
+    return result
+
+
+def compute_signature(post: Dict) -> Optional[List[int]]:
+    features = shingles(post)
+    if not features:
+        return None
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=4).digest(), "big") for feature in features),
+        dtype=np.uint64,
+        count=len(features)
+    )
+    permuted = (hashes[:, None] * _PERM_A[None, :] + _PERM_B[None, :]) % np.uint64(_PRIME)
+    return permuted.min(axis=0).tolist()
+
+
+def band_keys(signature: List[int]) -> List[str]:
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(repr(rows).encode("ascii"), digest_size=8).hexdigest()
+        keys.append(f"{band}:{digest}")
+    return keys
+
+
+def estimate_similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity: fraction of matching MinHash slots"""
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERMUTATIONS
+
+
+class DuplicateIndex:
+    """
+    LSH index over post signatures in the `post_signatures` collection.
+
+    A multikey index on (user_id, bands) turns a duplicate lookup into a
+    handful of index probes; only posts sharing at least one band are scored.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    @staticmethod
+    def _document(post: Dict, signature: List[int]) -> Dict:
+        return {
+            "_id": post["_id"],
+            "user_id": post["user_id"],
+            "signature": signature,
+            "bands": band_keys(signature),
+        }
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("user_id", 1), ("bands", 1)])
+
+    async def upsert(self, post: Dict):
+        """Store (or refresh) the signature of a created/updated post"""
+        signature = compute_signature(post)
+        if signature is None:
+            await self.remove(post["_id"])
+            return
+        await self.collection.replace_one({"_id": post["_id"]}, self._document(post, signature), upsert=True)
+
+    async def upsert_many(self, posts: List[Dict]):
+        """Batched upsert for bulk writes: one round trip per call"""
+        operations = []
+        for post in posts:
+            signature = compute_signature(post)
+            if signature is None:
+                operations.append(DeleteOne({"_id": post["_id"]}))
+            else:
+                operations.append(ReplaceOne({"_id": post["_id"]}, self._document(post, signature), upsert=True))
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def remove(self, post_id: str):
+        await self.collection.delete_one({"_id": post_id})
+
+    async def remove_many(self, post_ids: List[str]):
+        if post_ids:
+            await self.collection.delete_many({"_id": {"$in": post_ids}})
+
+    async def find_duplicates(
+        self,
+        post: Dict,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        limit: int = 10
+    ) -> List[Dict]:
+        """Likely near-duplicates of a post among the same user's posts, most similar first"""
+        signature = compute_signature(post)
+        if signature is None:
+            return []
+
+        keys = band_keys(signature)
+        # Posts sharing more bands are more similar, so keep the MAX_CANDIDATES best-matching ones
+        candidates = self.collection.aggregate([
+            {"$match": {
+                "user_id": post["user_id"],
+                "bands": {"$in": keys},
+                "_id": {"$ne": post.get("_id")},
+            }},
+            {"$project": {"signature": 1, "matched_bands": {"$size": {"$setIntersection": ["$bands", keys]}}}},
+            {"$sort": {"matched_bands": -1, "_id": 1}},
+            {"$limit": MAX_CANDIDATES},
+        ])
+
+        matches = []
+        async for candidate in candidates:
+            similarity = estimate_similarity(signature, candidate["signature"])
+            if similarity >= threshold:
+                matches.append({"post_id": candidate["_id"], "similarity": round(similarity, 3)})
+
+        matches.sort(key=lambda match: -match["similarity"])
+        return matches[:limit]
+
+    async def backfill(self, posts_collection, user_id: Optional[str] = None) -> int:
+        """Compute signatures for existing posts; returns the number written"""
+        query = {"user_id": user_id} if user_id else {}
+        written = 0
+        batch = []
+        async for post in posts_collection.find(query, SIGNATURE_FIELDS).batch_size(BACKFILL_BATCH_SIZE):
+            signature = compute_signature(post)
+            if signature is None:
+                continue
+            batch.append(ReplaceOne({"_id": post["_id"]}, self._document(post, signature), upsert=True))
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                await self.collection.bulk_write(batch, ordered=False)
+                written += len(batch)
+                batch = []
+        if batch:
+            await self.collection.bulk_write(batch, ordered=False)
+            written += len(batch)
+        return written
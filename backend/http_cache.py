@@ -0,0 +1,90 @@
+"""
+HTTP conditional request helpers
+Strong ETags derived from the serialized response body or a document version, plus If-None-Match handling
+"""
+import hashlib
+from typing import Optional
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response
+
+# Suffixes appended to an ETag by CompressionMiddleware so each encoding has its own strong validator
+ENCODING_ETAG_SUFFIXES = ("-gzip", "-br")
+
+
+def compute_etag(body: bytes) -> str:
+    """Strong ETag for a response body"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def version_etag(*parts) -> str:
+    """Strong ETag for a response identified by a cheap version (e.g. max updated_at and a count) instead of its body"""
+    return compute_etag(orjson.dumps(parts))
+
+
+def _normalize_etag(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in ENCODING_ETAG_SUFFIXES:
+        if tag.endswith(suffix):
+            tag = tag[: -len(suffix)]
+            break
+    return tag
+
+
+def matching_etag(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """
+    The If-None-Match entry that matches an ETag (weak comparison, as RFC 9110 requires for GET), or None.
+
+    Encoding suffixes are ignored when comparing, and the client's own entry is
+    returned so a 304 names the variant (e.g. "...-br") it already holds.
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    target = _normalize_etag(etag)
+    for candidate in if_none_match.split(","):
+        if _normalize_etag(candidate) == target:
+            return candidate.strip()
+    return None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag"""
+    return matching_etag(if_none_match, etag) is not None
+
+
+def _cache_headers(etag: str) -> dict:
+    return {
+        "ETag": etag,
+        # Responses are per-user; clients must revalidate but may reuse the body on 304
+        "Cache-Control": "private, no-cache",
+    }
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304 Not Modified when the client already has the response tagged etag, else None"""
+    matched = matching_etag(request.headers.get("if-none-match"), etag)
+    if matched is None:
+        return None
+    # The 200 this stands in for is negotiated by CompressionMiddleware, which leaves 304s alone
+    return Response(status_code=304, headers={**_cache_headers(matched), "Vary": "Accept-Encoding"})
+
+
+def conditional_json(request: Request, content: dict, etag: Optional[str] = None) -> Response:
+    """
+    Serialize content once, tag it, and answer 304 Not Modified when the client already has it.
+
+    Pass a `version_etag` as etag to skip hashing the body; routes that can
+    compute one should call `not_modified` first and skip loading the content.
+    """
+    body = orjson.dumps(content)
+    etag = etag or compute_etag(body)
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+    return Response(content=body, media_type="application/json", headers=_cache_headers(etag))
@@ -0,0 +1,175 @@
+"""
+Idempotency keys for non-idempotent POST routes
+The first response for an Idempotency-Key is stored in Mongo and replayed verbatim to retries
+"""
+import asyncio
+import hashlib
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+import orjson
+from bson import Binary
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse, Response
+from pymongo.errors import DuplicateKeyError
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_LOCK_SECONDS = 300  # An in-progress claim older than this is treated as abandoned
+MAX_STORED_BODY_BYTES = 8 * 1024 * 1024  # Compressed; keeps records well under Mongo's 16 MB limit
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Hash of the request a key was first used with; a key can't be reused for a different request"""
+    return hashlib.sha256(orjson.dumps(parts, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Records in `idempotency_keys` are claimed with an insert (the unique _id
+    is the lock), completed with the stored response and expire via a TTL
+    index on `expires_at`.
+
+    A duplicate that arrives while the original is running waits for it
+    (on an in-process future when both hit the same worker, by polling
+    otherwise) and then replays its response. 4xx outcomes are stored like
+    successes; 5xx outcomes and crashes release the key so a retry runs again.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def run(
+        self,
+        key: Optional[str],
+        user_id: str,
+        operation: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Execute `handler` once per (user, operation, key); without a key it simply runs"""
+        if key is None:
+            return await handler()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+        record_id = f"{user_id}:{operation}:{key}"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+        poll_delay = 0.05
+        while True:
+            record = await self._claim(record_id, fingerprint)
+            if record is None:
+                return await self._execute(record_id, handler)
+            if record.get("fingerprint") != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+            if record["state"] == "completed":
+                return self._replay(record)
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            pending = self._inflight.get(record_id)
+            if pending is not None:
+                await asyncio.wait({pending}, timeout=remaining)
+            else:
+                await asyncio.sleep(min(poll_delay, remaining))
+                poll_delay = min(poll_delay * 2, 0.5)
+
+    async def _claim(self, record_id: str, fingerprint: str) -> Optional[Dict]:
+        """Claim the key (returns None) or return the record of whoever holds it"""
+        while True:
+            now = datetime.utcnow()
+            claim = {"state": "in_progress", "fingerprint": fingerprint, "created_at": now,
+                     "expires_at": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}
+            try:
+                await self.collection.insert_one({"_id": record_id, **claim})
+                return None
+            except DuplicateKeyError:
+                pass
+            # The owner died mid-request: take the stale claim over
+            taken = await self.collection.find_one_and_update(
+                {"_id": record_id, "state": "in_progress", "fingerprint": fingerprint, "expires_at": {"$lt": now}},
+                {"$set": claim}
+            )
+            if taken is not None:
+                return None
+            record = await self.collection.find_one({"_id": record_id})
+            if record is not None:
+                return record
+            # Released between the insert and the lookup; claim again
+
+    async def _execute(self, record_id: str, handler: Callable[[], Awaitable[Any]]) -> Response:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[record_id] = future
+        try:
+            try:
+                response = self._as_response(await handler())
+            except HTTPException as error:
+                if error.status_code >= 500:
+                    raise
+                response = ORJSONResponse({"detail": error.detail}, status_code=error.status_code, headers=error.headers)
+
+            if response.status_code >= 500:
+                await self._release(record_id)
+            else:
+                await self._store(record_id, response)
+            return response
+        except asyncio.CancelledError:
+            # Client went away: the cancelled coroutine can't await, so release in the background
+            task = asyncio.create_task(self._release(record_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            raise
+        except BaseException:
+            await self._release(record_id)
+            raise
+        finally:
+            self._inflight.pop(record_id, None)
+            future.set_result(None)  # Waiters re-check the record: replay it, or claim a released key
+
+    @staticmethod
+    def _as_response(result: Any) -> Response:
+        return result if isinstance(result, Response) else ORJSONResponse(result)
+
+    async def _store(self, record_id: str, response: Response):
+        now = datetime.utcnow()
+        completed = {
+            "state": "completed",
+            "status_code": response.status_code,
+            "media_type": response.media_type,
+            "completed_at": now,
+            "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        }
+        body = zlib.compress(bytes(response.body), 1)
+        if len(body) <= MAX_STORED_BODY_BYTES:
+            completed["body"] = Binary(body)
+        else:
+            completed["body_too_large"] = True
+        await self.collection.update_one({"_id": record_id}, {"$set": completed})
+
+    async def _release(self, record_id: str):
+        await self.collection.delete_one({"_id": record_id, "state": "in_progress"})
+
+    @staticmethod
+    def _replay(record: Dict) -> Response:
+        if "body" not in record:
+            raise HTTPException(
+                status_code=409,
+                detail="The original request with this Idempotency-Key completed, but its response is too large to replay"
+            )
+        return Response(
+            content=zlib.decompress(record["body"]),
+            status_code=record["status_code"],
+            media_type=record.get("media_type"),
+            headers={REPLAYED_HEADER: "true"}
+        )
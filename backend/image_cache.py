@@ -0,0 +1,215 @@
+"""
+Disk-backed cache for generated images
+Content-addressed by prompt parameters, size-bounded with LRU eviction and memory-mapped reads
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pinspire-image-cache"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 1 GiB
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() != "false"
+IMAGE_CACHE_RESCAN_SECONDS = int(os.getenv("IMAGE_CACHE_RESCAN_SECONDS", "60"))
+
+
+def make_cache_key(**params) -> str:
+    """Stable key for a set of generation parameters"""
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """
+    Size-bounded on-disk image cache.
+
+    Entries live in `<directory>/<key[:2]>/<key>`. Recency is tracked in memory
+    (and mirrored to file mtimes so it survives restarts); the least recently
+    used entries are deleted once the total size exceeds `max_bytes`.
+
+    The directory is shared by all worker processes: a lookup that misses the
+    in-memory index adopts the file if another worker wrote it, and the index
+    is rebuilt from disk before every write (and every `rescan_seconds`) so
+    `max_bytes` bounds the directory as a whole rather than each process's share.
+    """
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES, enabled: bool = IMAGE_CACHE_ENABLED,
+                 rescan_seconds: int = IMAGE_CACHE_RESCAN_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.rescan_seconds = rescan_seconds
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> size, least recent first
+        self._total_bytes = 0
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load_index(self, force: bool = False):
+        """Rebuild the LRU order from files on disk (oldest mtime first), at most every rescan_seconds unless forced"""
+        now = time.monotonic()
+        if not force and self._loaded_at is not None and now - self._loaded_at < self.rescan_seconds:
+            return
+        found = []
+        if os.path.isdir(self.directory):
+            for shard in os.scandir(self.directory):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        stat = entry.stat()
+                        found.append((stat.st_mtime, entry.name, stat.st_size))
+        found.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in found)
+        self._total_bytes = sum(size for _, _, size in found)
+        self._loaded_at = now
+
+    def _read_base64(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        with self._lock:
+            self._load_index()
+            if key not in self._entries:
+                # Possibly written by another worker since the last scan
+                try:
+                    size = os.stat(path).st_size
+                except FileNotFoundError:
+                    return None
+                self._entries[key] = size
+                self._total_bytes += size
+            self._entries.move_to_end(key)
+        try:
+            with open(path, "rb") as handle:
+                with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    # Encode straight from the mapping; the raw bytes are never copied into Python
+                    encoded = base64.b64encode(mapped).decode("ascii")
+            os.utime(path)
+            return encoded
+        except (FileNotFoundError, ValueError):
+            # Removed by another worker (or empty file); forget it
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            # Writes are rare next to generations; rescanning here sees other workers' entries before evicting
+            self._load_index(force=True)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self.writes += 1
+            victims = []
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                victim, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                self.evictions += 1
+                victims.append(victim)
+
+        for victim in victims:
+            try:
+                os.remove(self._path(victim))
+            except FileNotFoundError:
+                pass
+
+    async def get_or_create(self, key: str, producer: Callable[[], Awaitable[bytes]], fresh: bool = False) -> Tuple[str, bool]:
+        """
+        Return (base64 image, cache_hit).
+
+        `fresh` skips the lookup and replaces the cached entry with a new
+        generation. Concurrent misses for the same key share one producer call;
+        if the producing request is cancelled, a waiter takes over as producer.
+        """
+        if not self.enabled:
+            return base64.b64encode(await producer()).decode("ascii"), False
+
+        while not fresh:
+            cached = await asyncio.to_thread(self._read_base64, key)
+            if cached is not None:
+                self.hits += 1
+                return cached, True
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            try:
+                # Shared with another request's generation: neither a hit nor a miss of its own
+                return await asyncio.shield(pending), False
+            except asyncio.CancelledError:
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise  # This request itself was cancelled
+                # The producing request was cancelled (shed or disconnected); look again or produce
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        if not fresh:
+            self._inflight[key] = future
+        try:
+            data = await producer()
+            await asyncio.to_thread(self._write, key, data)
+            encoded = base64.b64encode(data).decode("ascii")
+            future.set_result(encoded)
+            return encoded, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # Waiters re-raise it; mark retrieved so an unshared failure isn't logged
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._load_index()
+            entries = len(self._entries)
+            total_bytes = self._total_bytes
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "writes": self.writes,
+        }
+
+
+# Singleton instance
+image_cache = ImageCache()
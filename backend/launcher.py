@@ -0,0 +1,56 @@
+"""
+Production launcher for the Pinspire API
+Runs uvicorn with several worker processes, uvloop/httptools and graceful draining, configured from the environment
+"""
+import importlib.util
+import os
+from typing import Dict
+
+
+def uvicorn_options() -> Dict:
+    """
+    Settings for uvicorn.run, from the environment:
+
+    WEB_CONCURRENCY          worker processes (default 1; about one per CPU core in production)
+    HOST / PORT              bind address (default 0.0.0.0:8001)
+    GRACEFUL_SHUTDOWN_SECONDS  how long in-flight requests may finish after SIGTERM before
+                             their tasks are cancelled; open event streams end then and reconnect (default 30)
+    KEEPALIVE_SECONDS        idle keep-alive timeout; keep above the proxy's (default 75)
+    BACKLOG                  listen backlog (default 2048)
+    FORWARDED_ALLOW_IPS      proxies trusted for X-Forwarded-For, so rate limits see client IPs (default 127.0.0.1)
+    ACCESS_LOG               "false" turns off per-request access logging (slow requests are still logged)
+
+    Each worker has its own Mongo pool (MONGO_MAX_POOL_SIZE) and admission
+    pools, so both are per process, as are the per-IP rate limit (a client
+    may get WEB_CONCURRENCY times the configured limit) and the search and
+    suggestion caches. Those caches and live post events follow writes made
+    by other workers through change streams, which need a replica set;
+    against a standalone mongod, keep WEB_CONCURRENCY at 1 (otherwise other
+    workers' writes show up in search only after SEARCH_INDEX_TTL_SECONDS).
+    """
+    has_uvloop = importlib.util.find_spec("uvloop") is not None
+    has_httptools = importlib.util.find_spec("httptools") is not None
+    return {
+        "host": os.getenv("HOST", "0.0.0.0"),
+        "port": int(os.getenv("PORT", "8001")),
+        "workers": int(os.getenv("WEB_CONCURRENCY", "1")),
+        "loop": "uvloop" if has_uvloop else "asyncio",
+        "http": "httptools" if has_httptools else "h11",
+        "timeout_graceful_shutdown": int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30")),
+        "timeout_keep_alive": int(os.getenv("KEEPALIVE_SECONDS", "75")),
+        "backlog": int(os.getenv("BACKLOG", "2048")),
+        "proxy_headers": True,
+        "forwarded_allow_ips": os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        "access_log": os.getenv("ACCESS_LOG", "true").lower() != "false",
+    }
+
+
+def run():
+    import uvicorn
+
+    # An import string lets every worker process load its own app (and Mongo client)
+    uvicorn.run("server:app", **uvicorn_options())
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,398 @@
+"""
+Pure ASGI middleware for the Pinspire API
+Implemented against the raw ASGI interface so streaming responses pass through untouched
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+import uuid
+import zlib
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from admission import AdmissionController, AdmissionRejected, current_deadline
+from query_monitor import current_request_id
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Content types that are already compressed (or must not be buffered) and are sent as-is
+UNCOMPRESSIBLE_CONTENT_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "font/woff",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/octet-stream",
+    "text/event-stream",
+)
+
+
+def _parse_accept_encoding(value: str) -> List[Tuple[str, float]]:
+    encodings = []
+    for part in value.split(","):
+        pieces = part.strip().split(";")
+        name = pieces[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in pieces[1:]:
+            key, _, raw = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(raw)
+                except ValueError:
+                    quality = 0.0
+        encodings.append((name, quality))
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported content coding for an Accept-Encoding header"""
+    accepted = {name: quality for name, quality in _parse_accept_encoding(accept_encoding)}
+    wildcard = accepted.get("*", 0.0)
+
+    supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best, best_quality = None, 0.0
+    for encoding in supported:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class _Compressor:
+    """Incremental gzip/brotli compressor with a common interface"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._impl = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._impl = zlib.compressobj(gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._impl.process(data)
+            return out + self._impl.flush() if flush else out
+        out = self._impl.compress(data)
+        return out + self._impl.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._impl.process(data) + self._impl.finish()
+        return self._impl.compress(data) + self._impl.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """
+    Negotiated gzip/brotli response compression.
+
+    Small bodies, already-encoded responses and binary media types are passed
+    through untouched so image payloads are never compressed twice. Streaming
+    bodies are compressed chunk by chunk and flushed as they arrive. Every
+    compressible response carries Vary: Accept-Encoding, compressed or not.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Responses that could have been compressed vary on Accept-Encoding even when this client gets identity
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+def _vary_on_encoding(headers: MutableHeaders) -> None:
+    if "accept-encoding" not in headers.get("vary", "").lower():
+        headers.add_vary_header("Accept-Encoding")
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: Optional[str], send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    def _should_compress(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").lower()
+        return not content_type.startswith(UNCOMPRESSIBLE_CONTENT_TYPES)
+
+    def _rewrite_headers(self, streaming: bool, body_length: int = 0) -> None:
+        headers = MutableHeaders(scope=self.start_message)
+        headers["Content-Encoding"] = self.encoding
+
+        # A strong ETag identifies one exact byte sequence, so each encoding gets its own tag
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/") and etag.endswith('"'):
+            headers["ETag"] = etag[:-1] + "-" + self.encoding + '"'
+
+        if streaming:
+            if "content-length" in headers:
+                del headers["content-length"]
+        else:
+            headers["Content-Length"] = str(body_length)
+        self.start_message["headers"] = headers.raw
+
+    async def send(self, message: Message) -> None:
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            self.start_message = message
+            headers = MutableHeaders(scope=message)
+            if message["status"] < 200 or message["status"] in (204, 304) or not self._should_compress(headers):
+                # 304s come from conditional_json, which sets Vary and names the variant the client holds
+                self.passthrough = True
+                await self.downstream(message)
+                return
+            _vary_on_encoding(headers)
+            message["headers"] = headers.raw
+            if self.encoding is None:
+                self.passthrough = True
+                await self.downstream(message)
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            if not more_body:
+                # Whole body in one message: compress only when it is worth it
+                if len(body) < self.middleware.minimum_size:
+                    self.passthrough = True
+                    await self.downstream(self.start_message)
+                    await self.downstream(message)
+                    return
+                compressed = _Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality).finish(body)
+                self._rewrite_headers(streaming=False, body_length=len(compressed))
+                await self.downstream(self.start_message)
+                await self.downstream({"type": "http.response.body", "body": compressed})
+                return
+
+            self.compressor = _Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+            self._rewrite_headers(streaming=True)
+            await self.downstream(self.start_message)
+
+        if more_body:
+            chunk = self.compressor.compress(body, flush=True)
+            if chunk:
+                await self.downstream({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            await self.downstream({"type": "http.response.body", "body": self.compressor.finish(body)})
+
+
+class RateLimitMiddleware:
+    """
+    Sliding-window request limit per client IP.
+
+    Rejected requests get a 429 without reaching the app. Clients idle for a
+    whole window are dropped periodically so the table doesn't grow forever.
+    Counts are kept per worker process, so with WEB_CONCURRENCY workers a
+    client may get up to WEB_CONCURRENCY times `max_requests` per window.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_requests: int = 300,
+        window_seconds: float = 60,
+        exclude_paths: Iterable[str] = ()
+    ):
+        self.app = app
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.exclude_paths = frozenset(exclude_paths)
+        self._clients: Dict[str, Deque[float]] = {}
+        self._next_sweep = time.monotonic() + window_seconds
+
+    def _sweep(self, now: float):
+        cutoff = now - self.window_seconds
+        for client, hits in list(self._clients.items()):
+            if not hits or hits[-1] < cutoff:
+                del self._clients[client]
+        self._next_sweep = now + self.window_seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        client = (scope.get("client") or ("unknown",))[0]
+        hits = self._clients.get(client)
+        if hits is None:
+            hits = self._clients[client] = deque(maxlen=self.max_requests)
+        cutoff = now - self.window_seconds
+        while hits and hits[0] < cutoff:
+            hits.popleft()
+
+        if len(hits) >= self.max_requests:
+            retry_after = max(1, int(hits[0] + self.window_seconds - now + 1))
+            body = orjson.dumps({
+                "detail": f"Rate limit exceeded. Maximum {self.max_requests} requests per {int(self.window_seconds)} seconds. Please slow down."
+            })
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"retry-after", str(retry_after).encode("latin-1")),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        hits.append(now)
+        await self.app(scope, receive, send)
+
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+class RequestContextMiddleware:
+    """
+    Request IDs and timing.
+
+    Reuses a well-formed incoming X-Request-ID (so IDs can be followed across
+    proxies) or generates one, exposes it to the app through the
+    `current_request_id` context variable, and echoes it on the response
+    together with a Server-Timing header (time until the response started).
+    Requests slower than SLOW_REQUEST_MS end to end are logged, except
+    event streams, which are long-lived by design.
+    """
+
+    def __init__(self, app: ASGIApp, slow_request_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = Headers(scope=scope).get("x-request-id", "")
+        request_id = incoming if _REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        token = current_request_id.set(request_id)
+        started = time.perf_counter()
+        status_code = 500
+        event_stream = False
+
+        async def send_with_context(message: Message) -> None:
+            nonlocal status_code, event_stream
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                event_stream = Headers(raw=message.get("headers", [])).get("content-type", "").startswith("text/event-stream")
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1")),
+                    (b"server-timing", f"app;dur={elapsed_ms:.1f}".encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_context)
+        finally:
+            current_request_id.reset(token)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if elapsed_ms >= self.slow_request_ms and not event_stream:
+                logger.warning(
+                    "Slow request %s %s -> %s in %.0f ms (request id %s)",
+                    scope["method"], scope["path"], status_code, elapsed_ms, request_id
+                )
+
+
+class AdmissionMiddleware:
+    """
+    Per-endpoint-class admission control (see admission.py).
+
+    `classes` maps path prefixes to pool names, first match wins; other
+    `/api` paths use `default_pool`. Requests that can't get a slot in time
+    are shed with a 503 and Retry-After before any work is done. An admitted
+    request keeps its slot until its response has been sent.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        controller: AdmissionController,
+        classes: Iterable[Tuple[str, str]] = (),
+        default_pool: Optional[str] = None,
+        exclude_paths: Iterable[str] = ()
+    ):
+        self.app = app
+        self.controller = controller
+        self.classes = list(classes)
+        self.default_pool = default_pool
+        self.exclude_paths = frozenset(exclude_paths)
+
+    def classify(self, path: str) -> Optional[str]:
+        if path in self.exclude_paths:
+            return None
+        for prefix, pool in self.classes:
+            if path.startswith(prefix):
+                return pool
+        return self.default_pool if path.startswith("/api/") else None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        pool_name = self.classify(scope["path"]) if scope["type"] == "http" else None
+        if pool_name is None or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        pool = self.controller.pools[pool_name]
+        try:
+            await pool.acquire()
+        except AdmissionRejected as rejected:
+            body = orjson.dumps({"detail": f"Server busy ({rejected.pool} capacity, {rejected.reason}). Please retry shortly."})
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"retry-after", str(rejected.retry_after).encode("latin-1")),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        token = current_deadline.set(asyncio.get_running_loop().time() + pool.deadline)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_deadline.reset(token)
+            pool.release()
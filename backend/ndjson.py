@@ -0,0 +1,116 @@
+"""
+Newline-delimited JSON helpers
+Incremental parsing of bulk request bodies and streaming of cursors as NDJSON
+"""
+import os
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple
+
+import orjson
+from fastapi import Request
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_CHUNK_BYTES = 64 * 1024  # Coalesce small records into fewer ASGI sends
+# One NDJSON item; Mongo documents can't exceed 16 MB anyway
+MAX_NDJSON_LINE_BYTES = int(os.getenv("MAX_NDJSON_LINE_BYTES", str(16 * 1024 * 1024)))
+
+
+class BulkBodyError(ValueError):
+    """The request body as a whole is unusable (not JSON, not an array)"""
+
+
+class BulkLimitExceeded(BulkBodyError):
+    """More items than a single bulk request may carry"""
+
+
+class BulkLineTooLong(BulkLimitExceeded):
+    """An NDJSON line longer than MAX_NDJSON_LINE_BYTES"""
+
+
+def is_ndjson(request: Request) -> bool:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    return content_type in (NDJSON_MEDIA_TYPE, "application/jsonl", "application/ndjson")
+
+
+async def iter_request_items(request: Request, max_items: int) -> AsyncIterator[Tuple[int, Any, Optional[str]]]:
+    """
+    Yield (index, item, error) for each item of a bulk request body.
+
+    NDJSON bodies are parsed line by line as they arrive, so a large import is
+    never held in memory as a whole; a malformed line becomes a per-item error
+    and a line over MAX_NDJSON_LINE_BYTES ends the body with BulkLineTooLong.
+    Any other body must be a JSON array.
+    """
+    if not is_ndjson(request):
+        try:
+            items = orjson.loads(await request.body())
+        except orjson.JSONDecodeError as error:
+            raise BulkBodyError(f"Invalid JSON body: {error}")
+        if not isinstance(items, list):
+            raise BulkBodyError("Body must be a JSON array (or NDJSON with Content-Type: application/x-ndjson)")
+        if len(items) > max_items:
+            raise BulkLimitExceeded(f"Too many items: at most {max_items} per request")
+        for index, item in enumerate(items):
+            yield index, item, None
+        return
+
+    index = 0
+    buffer = bytearray()
+
+    def parse(line: bytearray) -> Tuple[Any, Optional[str]]:
+        if len(line) > MAX_NDJSON_LINE_BYTES:
+            raise BulkLineTooLong(f"Item {index + 1} is longer than {MAX_NDJSON_LINE_BYTES} bytes")
+        if index >= max_items:
+            raise BulkLimitExceeded(f"Too many items: at most {max_items} per request")
+        try:
+            return orjson.loads(line), None
+        except orjson.JSONDecodeError as error:
+            return None, f"Invalid JSON: {error}"
+
+    async for chunk in request.stream():
+        # Only the new bytes are searched for newlines, and consumed lines are dropped in place
+        search_from = len(buffer)
+        buffer += chunk
+        line_start = 0
+        while (line_end := buffer.find(b"\n", search_from)) >= 0:
+            line = buffer[line_start:line_end]
+            line_start = search_from = line_end + 1
+            if line.strip():
+                item, error = parse(line)
+                yield index, item, error
+                index += 1
+        del buffer[:line_start]
+        if len(buffer) > MAX_NDJSON_LINE_BYTES:
+            raise BulkLineTooLong(f"Item {index + 1} is longer than {MAX_NDJSON_LINE_BYTES} bytes")
+
+    if buffer.strip():
+        item, error = parse(buffer)
+        yield index, item, error
+
+
+async def stream_cursor(
+    cursor,
+    transform: Optional[Callable[[Dict], Dict]] = None,
+    chunk_bytes: int = STREAM_CHUNK_BYTES
+) -> AsyncIterator[bytes]:
+    """
+    Serialize a Motor cursor as NDJSON, one document per line.
+
+    Only the cursor's current batch and one output chunk are held in memory,
+    so an export costs the same regardless of how many documents it covers.
+    """
+    pending = []
+    pending_bytes = 0
+    try:
+        async for document in cursor:
+            line = orjson.dumps(transform(document) if transform else document, option=orjson.OPT_APPEND_NEWLINE)
+            pending.append(line)
+            pending_bytes += len(line)
+            if pending_bytes >= chunk_bytes:
+                yield b"".join(pending)
+                pending = []
+                pending_bytes = 0
+        if pending:
+            yield b"".join(pending)
+    finally:
+        # Release the server-side cursor if the client disconnects mid-export
+        await cursor.close()
@@ -3,12 +3,18 @@ Pinterest API Integration Service
 Supports both mock mode (for testing) and real Pinterest API integration
 """
 import os
+import json
+import hashlib
+import re
 import httpx
 import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, AsyncIterator, Awaitable, Callable, Iterator
 from urllib.parse import urlencode
 
+from admission import remaining_seconds
+
 # Pinterest API Configuration
 PINTEREST_API_BASE = "https://api.pinterest.com/v5"
 PINTEREST_AUTH_URL = "https://www.pinterest.com/oauth/"
@@ -22,6 +28,99 @@ PINTEREST_REDIRECT_URI = os.getenv("PINTEREST_REDIRECT_URI", "http://localhost:3
 # Check if we're in mock mode
 IS_MOCK_MODE = PINTEREST_APP_ID.startswith("MOCK_") or not PINTEREST_APP_ID or not PINTEREST_APP_SECRET
 
+# Per-operation HTTP timeout; shortened to whatever is left of the request's deadline
+PINTEREST_HTTP_TIMEOUT = float(os.getenv("PINTEREST_HTTP_TIMEOUT", "30"))
+
+# Inline image uploads
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_UPLOADED_MEDIA_ENTRIES = 1024
+_MEDIA_DATA_PLACEHOLDER = "__PINSPIRE_MEDIA_DATA__"
+
+# Leading base64 characters of common image formats
+_BASE64_SIGNATURES = {
+    "iVBORw0KGgo": "image/png",
+    "/9j/": "image/jpeg",
+    "R0lGOD": "image/gif",
+    "UklGR": "image/webp",
+}
+_BASE64_PAYLOAD = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+
+# (account, content hash of uploaded image bytes) -> hosted Pinterest image URL, shared by all service instances
+_uploaded_media: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _base64_chunks(image_base64: str) -> Iterator[bytes]:
+    """ASCII bytes of a base64 string, UPLOAD_CHUNK_SIZE at a time, without encoding the whole string at once"""
+    for offset in range(0, len(image_base64), UPLOAD_CHUNK_SIZE):
+        yield image_base64[offset:offset + UPLOAD_CHUNK_SIZE].encode("ascii")
+
+
+def _content_digest(image_base64: str) -> str:
+    digest = hashlib.sha256()
+    for chunk in _base64_chunks(image_base64):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _media_key(access_token: str, image_base64: str) -> str:
+    """Upload cache key; scoped to the account's token so one account never reuses another's uploads"""
+    account = hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+    return f"{account}:{_content_digest(image_base64)}"
+
+
+def _checked_base64(payload: str) -> str:
+    """The payload is spliced into the pin JSON unescaped, so only the strict base64 alphabet is allowed"""
+    if not payload or len(payload) % 4 or not _BASE64_PAYLOAD.fullmatch(payload):
+        raise ValueError("Inline image is not valid base64")
+    return payload
+
+
+def _data_url_source(value: str) -> Dict:
+    header, _, payload = value.partition(",")
+    if not header.endswith(";base64"):
+        raise ValueError("Inline image data: URLs must be base64-encoded")
+    content_type = header[5:].split(";")[0] or "image/png"
+    return {"image_base64": _checked_base64(payload), "content_type": content_type}
+
+
+def media_source_from_post(image_url: Optional[str], image_data: Optional[str]) -> Optional[Dict]:
+    """
+    Work out how a post's image should be sent to Pinterest.
+
+    Returns {"image_url": ...} for hosted images, or {"image_base64": ..., "content_type": ...}
+    for `data:` URLs and raw base64 image_data; None if the post has no image.
+    image_url takes precedence over image_data. Raises ValueError for inline
+    images that aren't strict base64 (including `data:` URLs without `;base64`).
+    """
+    if image_url:
+        if image_url.startswith("data:"):
+            return _data_url_source(image_url)
+        return {"image_url": image_url}
+    if image_data:
+        if image_data.startswith("data:"):
+            return _data_url_source(image_data)
+        content_type = next(
+            (mime for prefix, mime in _BASE64_SIGNATURES.items() if image_data.startswith(prefix)),
+            "image/png"
+        )
+        return {"image_base64": _checked_base64(image_data), "content_type": content_type}
+    return None
+
+
+def _hosted_image_url(pin: Dict) -> Optional[str]:
+    """Largest image URL Pinterest reports for a created pin"""
+    images = (pin.get("media") or {}).get("images") or {}
+    for size in ("originals", "1200x", "600x"):
+        url = (images.get(size) or {}).get("url")
+        if url:
+            return url
+    return None
+
+
+def _http_client() -> httpx.AsyncClient:
+    """Client whose timeouts end no later than the current request's deadline"""
+    return httpx.AsyncClient(timeout=remaining_seconds(PINTEREST_HTTP_TIMEOUT))
+
 
 class PinterestService:
     """Pinterest API service with mock mode support"""
@@ -60,7 +159,7 @@ class PinterestService:
             }
         
         # Real Pinterest API call
-        async with httpx.AsyncClient() as client:
+        async with _http_client() as client:
             response = await client.post(
                 PINTEREST_TOKEN_URL,
                 data={
@@ -89,7 +188,7 @@ class PinterestService:
             }
         
         # Real Pinterest API call
-        async with httpx.AsyncClient() as client:
+        async with _http_client() as client:
             response = await client.post(
                 PINTEREST_TOKEN_URL,
                 data={
@@ -127,7 +226,7 @@ class PinterestService:
             ]
         
         # Real Pinterest API call
-        async with httpx.AsyncClient() as client:
+        async with _http_client() as client:
             response = await client.get(
                 f"{PINTEREST_API_BASE}/boards",
                 headers={
@@ -148,11 +247,20 @@ class PinterestService:
         board_id: str,
         title: str,
         description: str,
-        image_url: str,
-        link: Optional[str] = None
+        image_url: Optional[str] = None,
+        link: Optional[str] = None,
+        image_base64: Optional[str] = None,
+        content_type: str = "image/png"
     ) -> Dict:
-        """Create a pin on Pinterest"""
+        """Create a pin on Pinterest from a hosted image URL or inline base64 image bytes"""
+        if not image_url and not image_base64:
+            raise ValueError("create_pin requires image_url or image_base64")
+        
         if self.is_mock:
+            if image_base64:
+                # Pretend Pinterest hosted the uploaded bytes
+                digest = _content_digest(image_base64)[:16]
+                image_url = f"https://i.pinimg.com/originals/mock/{digest}.{content_type.split('/')[-1]}"
             # Mock pin creation response
             return {
                 "id": f"mock_pin_{uuid.uuid4().hex[:12]}",
@@ -176,30 +284,116 @@ class PinterestService:
             "board_id": board_id,
             "title": title,
             "description": description,
-            "media_source": {
-                "source_type": "image_url",
-                "url": image_url
-            }
         }
         
         if link:
             pin_data["link"] = link
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{PINTEREST_API_BASE}/pins",
-                json=pin_data,
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "Content-Type": "application/json"
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+        
+        async with _http_client() as client:
+            if image_base64:
+                pin_data["media_source"] = {
+                    "source_type": "image_base64",
+                    "content_type": content_type,
+                    "data": _MEDIA_DATA_PLACEHOLDER
                 }
-            )
+                response = await client.post(
+                    f"{PINTEREST_API_BASE}/pins",
+                    content=self._stream_json_with_media(pin_data, image_base64),
+                    headers=headers
+                )
+            else:
+                pin_data["media_source"] = {
+                    "source_type": "image_url",
+                    "url": image_url
+                }
+                response = await client.post(
+                    f"{PINTEREST_API_BASE}/pins",
+                    json=pin_data,
+                    headers=headers
+                )
             
             if response.status_code not in [200, 201]:
                 raise Exception(f"Failed to create pin: {response.text}")
             
             return response.json()
     
+    @staticmethod
+    async def _stream_json_with_media(pin_data: Dict, image_base64: str) -> AsyncIterator[bytes]:
+        """Stream the pin JSON body, splicing the base64 payload in chunks instead of building one big string"""
+        prefix, suffix = json.dumps(pin_data).split(_MEDIA_DATA_PLACEHOLDER)
+        yield prefix.encode("utf-8")
+        # Base64 is plain ASCII and needs no JSON escaping
+        for chunk in _base64_chunks(image_base64):
+            yield chunk
+        yield suffix.encode("utf-8")
+    
+    async def publish_pin(
+        self,
+        access_token: str,
+        board_ids: List[str],
+        title: str,
+        description: str,
+        image_url: Optional[str] = None,
+        link: Optional[str] = None,
+        image_base64: Optional[str] = None,
+        content_type: str = "image/png",
+        completed: Optional[Dict[str, Dict]] = None,
+        on_pin: Optional[Callable[[str, Dict], Awaitable[None]]] = None
+    ) -> List[Dict]:
+        """
+        Create the same pin on several boards.
+        
+        Inline image bytes are uploaded once (deduplicated by account and content
+        hash); the image URL Pinterest hosts for that first pin is reused for the
+        other boards and for the account's later publishes of the same image.
+        
+        Boards in `completed` (board id -> pin from an earlier, partially failed
+        attempt) are skipped and their pins returned as-is; `on_pin` is awaited
+        after each new pin so callers can record progress before the next board.
+        """
+        completed = completed or {}
+        media_key = None
+        if image_base64:
+            media_key = _media_key(access_token, image_base64)
+            hosted_url = _uploaded_media.get(media_key)
+            if hosted_url:
+                _uploaded_media.move_to_end(media_key)
+                image_url, image_base64 = hosted_url, None
+        
+        pins = []
+        for board_id in board_ids:
+            if board_id in completed:
+                pins.append(completed[board_id])
+                continue
+            pin = await self.create_pin(
+                access_token=access_token,
+                board_id=board_id,
+                title=title,
+                description=description,
+                image_url=image_url,
+                link=link,
+                image_base64=image_base64,
+                content_type=content_type
+            )
+            pins.append(pin)
+            if on_pin is not None:
+                await on_pin(board_id, pin)
+            
+            if image_base64:
+                hosted_url = _hosted_image_url(pin)
+                if hosted_url:
+                    _uploaded_media[media_key] = hosted_url
+                    while len(_uploaded_media) > MAX_UPLOADED_MEDIA_ENTRIES:
+                        _uploaded_media.popitem(last=False)
+                    image_url, image_base64 = hosted_url, None
+        
+        return pins
+    
     async def get_user_info(self, access_token: str) -> Dict:
         """Get Pinterest user account information"""
         if self.is_mock:
@@ -212,7 +406,7 @@ class PinterestService:
             }
         
         # Real Pinterest API call
-        async with httpx.AsyncClient() as client:
+        async with _http_client() as client:
             response = await client.get(
                 f"{PINTEREST_API_BASE}/user_account",
                 headers={
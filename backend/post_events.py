@@ -0,0 +1,225 @@
+"""
+Live post updates
+Per-user fan-out of post changes to server-sent-event subscribers, fed by Mongo change streams
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import orjson
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 64
+HEARTBEAT_SECONDS = 15
+WATCH_RETRY_SECONDS = 5
+CHANGE_STREAMS_UNSUPPORTED = 40573  # "$changeStream is only supported on replica sets"
+CHANGE_STREAM_HISTORY_LOST = 286  # The resume token has fallen off the oplog
+DELETION_RETENTION = timedelta(days=1)  # Deletion records outlive any resume token worth resuming from
+
+# Fields sent with every event; large text and image payloads never are
+EVENT_FIELDS = (
+    "_id", "title", "status", "scheduled_time", "published_at", "updated_at",
+    "pinterest_post_id", "pinterest_post_ids", "pinterest_boards_posted", "thumbnail_version",
+)
+
+
+def _change_pipeline(collections: List[str], fields: Iterable[str]) -> List[Dict]:
+    return [
+        {"$match": {"ns.coll": {"$in": collections}, "operationType": {"$in": ["insert", "update", "replace"]}}},
+        # Trim on the server: updateLookup returns whole posts (inline images included)
+        {"$project": {
+            "operationType": 1,
+            "ns": 1,
+            **{f"fullDocument.{field}": 1 for field in sorted(set(fields) | set(EVENT_FIELDS) | {"user_id", "post"})},
+            "changed": {"$map": {
+                "input": {"$objectToArray": {"$ifNull": ["$updateDescription.updatedFields", {}]}},
+                "in": "$$this.k",
+            }},
+        }},
+    ]
+
+_EVENT_TYPES = {"insert": "created", "update": "updated", "replace": "updated"}
+
+HEARTBEAT = b": keep-alive\n\n"
+
+
+def _frame(event_type: str, payload: Dict) -> bytes:
+    return b"event: post." + event_type.encode("ascii") + b"\ndata: " + orjson.dumps(payload) + b"\n\n"
+
+
+class Subscription:
+    """One connected client; a bounded queue of pre-encoded SSE frames"""
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, frame: bytes):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # A client this far behind has missed events anyway: drop the backlog and ask it to reload
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_frame("resync", {}))
+
+
+class PostEventBroker:
+    """
+    Fans post changes out to every open SSE stream of the post's owner.
+
+    Inserts and updates come from a change stream on `posts`, so writes made
+    by any worker (or the thumbnail pipeline) reach every subscriber. Delete
+    change events carry no `user_id`, so `publish_deleted` inserts a record
+    of each deleted post into `deletions`, watched by the same stream
+    (archival removes posts without one, so it isn't reported as a delete).
+    Without a replica set, change streams are unavailable and the routes' own
+    `publish` calls feed subscribers in this process only; run a single
+    worker (WEB_CONCURRENCY=1) there. Each event is encoded once, however
+    many clients receive it.
+
+    Listeners added with `add_listener` see every streamed change as
+    (event type, user_id, post), with `document_fields` included in the
+    post, so per-process caches can follow writes made by other workers.
+    They get ("resync", None, {}) when the stream lost history and restarted.
+    """
+
+    def __init__(self, collection, deletions_collection, document_fields: Iterable[str] = ()):
+        self.collection = collection
+        self.deletions = deletions_collection
+        self._pipeline = _change_pipeline([collection.name, deletions_collection.name], document_fields)
+        self._listeners: List[Callable[[str, Optional[str], Dict], None]] = []
+        self.change_streams = False
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._watcher: Optional[asyncio.Task] = None
+        self._resume_token = None
+
+    # Subscriptions
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.user_id]
+
+    async def stream(self, user_id: str):
+        """SSE body for one client: events as they arrive, with heartbeats to keep proxies from timing out"""
+        # Subscribed inside the generator so the finally clause always runs once it does
+        subscription = self.subscribe(user_id)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+        finally:
+            self.unsubscribe(subscription)
+
+    def _dispatch(self, user_id: Optional[str], event_type: str, post: Dict, changed: Iterable[str] = ()):
+        subscribers = self._subscribers.get(user_id)
+        if not subscribers:
+            return
+        payload = {"post": {field: post[field] for field in EVENT_FIELDS if field in post}, "changed": sorted(changed)}
+        frame = _frame(event_type, payload)
+        for subscription in list(subscribers):
+            subscription.offer(frame)
+
+    def add_listener(self, listener: Callable[[str, Optional[str], Dict], None]):
+        self._listeners.append(listener)
+
+    def _notify(self, event_type: str, user_id: Optional[str], post: Dict):
+        for listener in self._listeners:
+            try:
+                listener(event_type, user_id, post)
+            except Exception:
+                logger.exception("Post change listener failed")
+
+    # Sources
+
+    async def ensure_indexes(self):
+        await self.deletions.create_index("expires_at", expireAfterSeconds=0)
+
+    def publish(self, event_type: str, post: Dict, changed: Iterable[str] = ()):
+        """Called by the routes after an insert/update; ignored while the change stream covers them"""
+        if self.change_streams:
+            return
+        self._dispatch(post.get("user_id"), event_type, post, changed)
+
+    async def publish_deleted(self, posts: List[Dict]):
+        """Called by the routes after deleting posts; recorded for every worker's change stream"""
+        if not posts:
+            return
+        expires_at = datetime.utcnow() + DELETION_RETENTION
+        await self.deletions.insert_many([
+            {
+                "user_id": post.get("user_id"),
+                "post": {field: post[field] for field in EVENT_FIELDS if field in post},
+                "expires_at": expires_at,
+            }
+            for post in posts
+        ], ordered=False)
+        if not self.change_streams:
+            for post in posts:
+                self._dispatch(post.get("user_id"), "deleted", post)
+
+    async def _watch(self):
+        while True:
+            try:
+                # Database-wide stream filtered to `posts` and `deletions`, so one cursor covers both
+                async with self.collection.database.watch(
+                    self._pipeline,
+                    full_document="updateLookup",
+                    resume_after=self._resume_token
+                ) as stream:
+                    while stream.alive:
+                        change = await stream.try_next()
+                        # The first getMore succeeded, so the routes can stop publishing inserts/updates
+                        self.change_streams = True
+                        self._resume_token = stream.resume_token
+                        post = change.get("fullDocument") if change else None
+                        if not post:
+                            continue
+                        if change["ns"]["coll"] == self.deletions.name:
+                            if change["operationType"] == "insert":
+                                self._dispatch(post.get("user_id"), "deleted", post.get("post") or {})
+                                self._notify("deleted", post.get("user_id"), post.get("post") or {})
+                        else:
+                            event_type = _EVENT_TYPES[change["operationType"]]
+                            self._dispatch(post.get("user_id"), event_type, post, change.get("changed", ()))
+                            self._notify(event_type, post.get("user_id"), post)
+            except OperationFailure as error:
+                if error.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams unavailable (standalone mongod); publishing post events in-process")
+                    self.change_streams = False
+                    return
+                logger.warning("Post change stream failed, resuming: %s", error)
+                if error.code == CHANGE_STREAM_HISTORY_LOST:
+                    self._resume_token = None
+                    self._notify("resync", None, {})
+            except PyMongoError as error:
+                logger.warning("Post change stream interrupted, resuming: %s", error)
+            await asyncio.sleep(WATCH_RETRY_SECONDS)
+
+    def start(self):
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        self.change_streams = False
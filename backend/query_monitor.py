@@ -0,0 +1,236 @@
+"""
+Mongo command monitoring
+PyMongo command listener that aggregates time per query shape, attributes it to routes and keeps a slow-operation log
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from pymongo import monitoring
+
+MONGO_SLOW_MS = float(os.getenv("MONGO_SLOW_MS", "100"))
+SLOW_LOG_SIZE = int(os.getenv("MONGO_SLOW_LOG_SIZE", "200"))
+MAX_SHAPES = 1000
+MAX_OPEN_CURSORS = 10000
+SHAPE_DEPTH = 6
+
+# Set per request (see server.py); Motor copies the context into its executor threads,
+# so the listener sees the values of the request that issued the command
+current_route: ContextVar[Optional[str]] = ContextVar("current_route", default=None)
+current_request_id: ContextVar[Optional[str]] = ContextVar("current_request_id", default=None)
+
+IGNORED_COMMANDS = {
+    "hello", "ismaster", "isMaster", "ping", "buildInfo", "endSessions",
+    "saslStart", "saslContinue", "authenticate", "getnonce", "killCursors",
+}
+
+# Where each command keeps the part of its body that determines the plan
+_FILTER_FIELDS = {
+    "find": ("filter", "sort"),
+    "count": ("query",),
+    "distinct": ("query",),
+    "findAndModify": ("query", "sort"),
+}
+_STATEMENT_FIELDS = {"update": ("updates", "q"), "delete": ("deletes", "q")}
+
+
+def _shape(value: Any, depth: int = 0) -> Any:
+    """Structure of a filter with every literal replaced by '?'"""
+    if depth >= SHAPE_DEPTH:
+        return "..."
+    if isinstance(value, dict):
+        return {key: _shape(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, list):
+        # $and/$or keep their clause shapes; $in/$nin value lists collapse to one '?'
+        if value and all(isinstance(item, dict) for item in value):
+            shapes = []
+            for item in value:
+                shaped = _shape(item, depth + 1)
+                if shaped not in shapes:
+                    shapes.append(shaped)
+            return shapes
+        return "?"
+    return "?"
+
+
+def _encode(value: Any) -> str:
+    return orjson.dumps(value, default=str).decode("utf-8")
+
+
+def command_shape(command_name: str, command: Dict) -> Tuple[str, str]:
+    """(collection, shape) of a command, e.g. ('posts', 'find {"user_id":"?"} sort {"created_at":-1}')"""
+    collection = command.get(command_name)
+    if not isinstance(collection, str):
+        collection = command.get("collection") if isinstance(command.get("collection"), str) else ""
+
+    parts = [command_name]
+    if command_name in _FILTER_FIELDS:
+        for field in _FILTER_FIELDS[command_name]:
+            if field in command:
+                # Sort directions are part of the shape, not literals
+                parts.append(f"{field} {_encode(command[field] if field == 'sort' else _shape(command[field]))}")
+    elif command_name in _STATEMENT_FIELDS:
+        statements_field, query_field = _STATEMENT_FIELDS[command_name]
+        statements = command.get(statements_field) or []
+        if statements:
+            parts.append(_encode(_shape(statements[0].get(query_field, {}))))
+    elif command_name == "aggregate":
+        stages = []
+        for stage in command.get("pipeline") or []:
+            name = next(iter(stage), "?")
+            stages.append(f"{name}{_encode(_shape(stage[name]))}" if name == "$match" else name)
+        parts.append(" | ".join(stages))
+    return collection, " ".join(parts)
+
+
+class _ShapeStats:
+    __slots__ = ("collection", "shape", "count", "failures", "total_ms", "max_ms", "routes")
+
+    def __init__(self, collection: str, shape: str):
+        self.collection = collection
+        self.shape = shape
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.routes: Dict[str, List[float]] = {}  # route -> [count, total_ms]
+
+    def as_dict(self) -> Dict:
+        routes = sorted(self.routes.items(), key=lambda item: -item[1][1])
+        return {
+            "collection": self.collection,
+            "shape": self.shape,
+            "count": self.count,
+            "failures": self.failures,
+            "total_ms": round(self.total_ms, 2),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 2),
+            "routes": [
+                {"route": route, "count": int(count), "total_ms": round(total, 2)}
+                for route, (count, total) in routes
+            ],
+        }
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """
+    Passed to the Mongo client as an event listener.
+
+    Commands are grouped by shape (command, collection and filter structure
+    with literals removed); getMore batches are attributed to the shape of the
+    find/aggregate that opened the cursor. Callbacks run on Motor's executor
+    threads, so all state is guarded by a lock.
+    """
+
+    def __init__(self, slow_ms: float = MONGO_SLOW_MS, slow_log_size: int = SLOW_LOG_SIZE):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._started: Dict[Tuple[Any, int], Tuple] = {}  # in-flight commands
+        self._cursors: "OrderedDict[int, Tuple[str, str]]" = OrderedDict()  # open cursor id -> (collection, shape)
+        self._shapes: Dict[Tuple[str, str], _ShapeStats] = {}
+        self._slow = deque(maxlen=slow_log_size)
+        self.since = time.time()
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        if event.command_name == "getMore":
+            cursor_id = event.command.get("getMore")
+            with self._lock:
+                collection, shape = self._cursors.get(cursor_id, (event.command.get("collection", ""), "getMore"))
+                if not shape.startswith("getMore"):
+                    shape = f"{shape} (getMore)"
+        else:
+            collection, shape = command_shape(event.command_name, event.command)
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = (
+                collection, shape, current_route.get(), current_request_id.get(),
+                event.command.get("getMore") if event.command_name == "getMore" else None
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, failed=False)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        collection, shape, route, request_id, cursor_id = started
+        duration_ms = event.duration_micros / 1000
+        route = route or "(background)"
+
+        with self._lock:
+            if cursor_id is not None:
+                if failed or not event.reply.get("cursor", {}).get("id"):
+                    self._cursors.pop(cursor_id, None)
+            elif not failed:
+                self._track_cursor(event, collection, shape)
+            stats = self._shapes.get((collection, shape))
+            if stats is None:
+                if len(self._shapes) >= MAX_SHAPES:
+                    collection, shape = "*", "(other shapes)"
+                    stats = self._shapes.get((collection, shape))
+                if stats is None:
+                    stats = self._shapes[(collection, shape)] = _ShapeStats(collection, shape)
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+            if failed:
+                stats.failures += 1
+            route_stats = stats.routes.setdefault(route, [0, 0.0])
+            route_stats[0] += 1
+            route_stats[1] += duration_ms
+
+            if duration_ms >= self.slow_ms:
+                self._slow.append({
+                    "at": time.time(),
+                    "duration_ms": round(duration_ms, 2),
+                    "command": event.command_name,
+                    "collection": collection,
+                    "shape": shape,
+                    "route": route,
+                    "request_id": request_id,
+                    "failed": failed,
+                })
+
+    def _track_cursor(self, event: monitoring.CommandSucceededEvent, collection: str, shape: str):
+        cursor = event.reply.get("cursor")
+        if not cursor or event.command_name == "getMore":
+            return
+        if cursor.get("id"):
+            self._cursors[cursor["id"]] = (collection, shape)
+            while len(self._cursors) > MAX_OPEN_CURSORS:
+                self._cursors.popitem(last=False)
+
+    def report(self, limit: int = 20) -> Dict:
+        with self._lock:
+            shapes = sorted(self._shapes.values(), key=lambda stats: -stats.total_ms)[:limit]
+            top = [stats.as_dict() for stats in shapes]
+            slow = list(self._slow)
+            tracked = len(self._shapes)
+        slow.reverse()
+        return {
+            "since": self.since,
+            "slow_threshold_ms": self.slow_ms,
+            "shapes_tracked": tracked,
+            "top_shapes": top,
+            "slow_operations": slow,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self._slow.clear()
+            self.since = time.time()
+
+
+# Singleton instance
+command_monitor = CommandMonitor()
@@ -0,0 +1,349 @@
+"""
+Full-text search over a user's posts
+Per-user in-process inverted index with field weighting, prefix matching and pagination
+"""
+import asyncio
+import logging
+import math
+import os
+import re
+import time
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Matches in the title count more than matches deep in the description.
+# Integer weights keep posting values in CPython's small-int cache.
+FIELD_WEIGHTS = {
+    "title": 6,
+    "tagged_topics": 4,
+    "caption": 3,
+    "description": 2,
+}
+
+# Very common words carry no ranking signal but would dominate posting list memory
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have how i in is it its my of on or our "
+    "so that the their this to was we what when with you your".split()
+)
+
+# Projection used when (re)building an index from Mongo
+INDEX_PROJECTION = {field: 1 for field in FIELD_WEIGHTS}
+INDEX_PROJECTION["created_at"] = 1
+
+PREFIX_MATCH_WEIGHT = 0.6
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 32
+BUILD_BATCH_SIZE = 1000
+
+SEARCH_INDEX_MAX_USERS = int(os.getenv("SEARCH_INDEX_MAX_USERS", "64"))
+# Edits made by other worker processes arrive through the post change stream; without a
+# replica set there is none, and indexes are rebuilt in the background this often instead
+SEARCH_INDEX_TTL_SECONDS = int(os.getenv("SEARCH_INDEX_TTL_SECONDS", "300"))
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _document_terms(post: Dict) -> Dict[str, int]:
+    """Weighted term frequencies for a post across all searchable fields"""
+    terms: Dict[str, int] = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        value = post.get(field)
+        if not value:
+            continue
+        text = " ".join(value) if isinstance(value, list) else str(value)
+        for token, count in Counter(tokenize(text)).items():
+            if token not in STOP_WORDS:
+                terms[token] = terms.get(token, 0) + weight * count
+    return terms
+
+
+def _saturate(frequencies: np.ndarray) -> np.ndarray:
+    # BM25-style saturation so a word repeated many times doesn't dominate
+    return frequencies / (frequencies + 2.4)
+
+
+def _timestamp(created_at: Optional[str]) -> float:
+    try:
+        return datetime.fromisoformat(created_at).timestamp() if created_at else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class _UserIndex:
+    """
+    Inverted index for a single user's posts, keyed internally by small integer doc numbers.
+
+    Postings are dicts so single posts can be added and removed cheaply; the
+    ones a query touches are converted to numpy arrays (cached until the term
+    changes) and scored in bulk.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_numbers: Dict[str, int] = {}
+        self.post_ids: List[Optional[str]] = []
+        self.doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self.created_at: List[float] = []  # Per doc number, for ranking ties
+        self.vocabulary: List[str] = []  # Sorted, for prefix expansion
+        self.built_at = time.monotonic()
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._created_array: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def add(self, post: Dict, bulk: bool = False):
+        """Index a post; bulk loads skip removal and defer vocabulary sorting to finish_bulk()"""
+        post_id = post["_id"]
+        if not bulk:
+            self.remove(post_id)
+
+        doc = len(self.post_ids)
+        self.post_ids.append(post_id)
+        self.doc_numbers[post_id] = doc
+        self.created_at.append(_timestamp(post.get("created_at")))
+        self._created_array = None
+
+        postings = self.postings
+        keys = []
+        for term, frequency in _document_terms(post).items():
+            docs = postings.get(term)
+            if docs is None:
+                docs = postings[term] = {}
+                if not bulk:
+                    insort(self.vocabulary, term)
+            docs[doc] = frequency
+            keys.append(term)
+            if not bulk:
+                self._arrays.pop(term, None)
+        self.doc_terms[doc] = tuple(keys)
+
+    def add_many(self, posts: List[Dict]):
+        for post in posts:
+            self.add(post, bulk=True)
+
+    def finish_bulk(self):
+        self.vocabulary = sorted(self.postings)
+
+    def remove(self, post_id: str):
+        doc = self.doc_numbers.pop(post_id, None)
+        if doc is None:
+            return
+        self.post_ids[doc] = None
+        for term in self.doc_terms.pop(doc, ()):
+            self._arrays.pop(term, None)
+            docs = self.postings.get(term)
+            if docs is None:
+                continue
+            docs.pop(doc, None)
+            if not docs:
+                del self.postings[term]
+                position = bisect_left(self.vocabulary, term)
+                if position < len(self.vocabulary) and self.vocabulary[position] == term:
+                    del self.vocabulary[position]
+
+    def expand(self, token: str) -> List[Tuple[str, float]]:
+        """Exact term plus vocabulary terms that start with it"""
+        expansions = [(token, 1.0)] if token in self.postings else []
+        if len(token) < MIN_PREFIX_LENGTH:
+            return expansions
+
+        position = bisect_left(self.vocabulary, token)
+        while position < len(self.vocabulary) and len(expansions) < MAX_PREFIX_EXPANSIONS:
+            term = self.vocabulary[position]
+            if not term.startswith(token):
+                break
+            if term != token:
+                expansions.append((term, PREFIX_MATCH_WEIGHT))
+            position += 1
+        return expansions
+
+    def _term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(doc numbers, frequencies) of a term's postings"""
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            docs = self.postings[term]
+            arrays = self._arrays[term] = (
+                np.fromiter(docs.keys(), dtype=np.int64, count=len(docs)),
+                np.fromiter(docs.values(), dtype=np.float64, count=len(docs)),
+            )
+        return arrays
+
+    def _created_times(self) -> np.ndarray:
+        if self._created_array is None:
+            self._created_array = np.array(self.created_at, dtype=np.float64)
+        return self._created_array
+
+    def search(self, query: str, offset: int, limit: int) -> Tuple[int, List[Tuple[str, float]]]:
+        tokens = [token for token in dict.fromkeys(tokenize(query)) if token not in STOP_WORDS]
+        if not tokens:
+            return 0, []
+
+        postings = self.postings
+        total_docs = len(self)
+        expanded = []
+        for token in tokens:
+            expansions = [
+                (self._term_arrays(term), weight * math.log(1 + total_docs / len(postings[term])))
+                for term, weight in self.expand(token)
+            ]
+            if not expansions:
+                return 0, []
+            expanded.append((sum(len(docs) for (docs, _), _ in expansions), expansions))
+
+        # Rarest token first: its documents are the only candidates the other tokens can keep
+        expanded.sort(key=lambda item: item[0])
+        candidates = None
+        combined = None
+        for _, expansions in expanded:
+            # Best score per document across the token's exact and prefix matches
+            token_scores = np.zeros(len(self.post_ids))
+            for (docs, frequencies), term_weight in expansions:
+                token_scores[docs] = np.maximum(token_scores[docs], term_weight * _saturate(frequencies))
+            if candidates is None:
+                candidates = np.flatnonzero(token_scores)
+                combined = token_scores[candidates]
+            else:
+                scores = token_scores[candidates]
+                matched = scores > 0
+                candidates, combined = candidates[matched], combined[matched] + scores[matched]
+            if not len(candidates):
+                return 0, []
+
+        # Top-k: only documents scoring at least the k-th best score are ordered (ties by recency)
+        total = len(candidates)
+        wanted = offset + limit
+        if total > wanted:
+            threshold = np.partition(combined, total - wanted)[total - wanted]
+            keep = combined >= threshold
+            candidates, combined = candidates[keep], combined[keep]
+        order = np.lexsort((-self._created_times()[candidates], -combined))[offset:wanted]
+        return total, [(self.post_ids[candidates[position]], float(combined[position])) for position in order]
+
+
+class PostSearchIndex:
+    """
+    Lazily built, incrementally maintained search indexes for recently active users.
+
+    An index is built from Mongo on a user's first search and then kept up to
+    date by create/update/delete. Tokenizing runs in a worker thread, batch by
+    batch as the cursor is read, so building never blocks the event loop.
+    Indexes older than SEARCH_INDEX_TTL_SECONDS keep serving while a fresh one
+    is built in the background. Least recently used indexes are evicted once
+    SEARCH_INDEX_MAX_USERS are loaded.
+    """
+
+    def __init__(self, max_users: int = SEARCH_INDEX_MAX_USERS, ttl_seconds: int = SEARCH_INDEX_TTL_SECONDS):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._indexes: "OrderedDict[str, _UserIndex]" = OrderedDict()
+        self._pending: Dict[str, List[Tuple[str, object]]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._refreshing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add_post(self, post: Dict):
+        """Index a created or updated post (no-op until the user's index is loaded)"""
+        user_id = post.get("user_id")
+        if user_id in self._pending:
+            self._pending[user_id].append(("add", post))
+        index = self._indexes.get(user_id)
+        if index is not None:
+            index.add(post)
+
+    def remove_post(self, user_id: str, post_id: str):
+        if user_id in self._pending:
+            self._pending[user_id].append(("remove", post_id))
+        index = self._indexes.get(user_id)
+        if index is not None:
+            index.remove(post_id)
+
+    async def _build(self, collection, user_id: str) -> _UserIndex:
+        index = _UserIndex()
+        # Writes that land while the cursor is being read are replayed afterwards
+        self._pending[user_id] = []
+        try:
+            cursor = collection.find({"user_id": user_id}, INDEX_PROJECTION).batch_size(BUILD_BATCH_SIZE)
+            batch = []
+            async for post in cursor:
+                batch.append(post)
+                if len(batch) >= BUILD_BATCH_SIZE:
+                    await asyncio.to_thread(index.add_many, batch)
+                    batch = []
+            await asyncio.to_thread(index.add_many, batch)
+            await asyncio.to_thread(index.finish_bulk)
+            for operation, payload in self._pending[user_id]:
+                if operation == "add":
+                    index.add(payload)
+                else:
+                    index.remove(payload)
+        finally:
+            self._pending.pop(user_id, None)
+        return index
+
+    def _store(self, user_id: str, index: _UserIndex):
+        self._indexes[user_id] = index
+        self._indexes.move_to_end(user_id)
+        while len(self._indexes) > self.max_users:
+            evicted_user, _ = self._indexes.popitem(last=False)
+            self._locks.pop(evicted_user, None)
+
+    async def _refresh(self, collection, user_id: str):
+        try:
+            async with self._locks.setdefault(user_id, asyncio.Lock()):
+                index = await self._build(collection, user_id)
+                # Skip if the index was evicted or invalidated meanwhile
+                if user_id in self._indexes:
+                    self._indexes[user_id] = index
+        except Exception as error:
+            logger.warning("Search index refresh for user %s failed: %s", user_id, error)
+        finally:
+            self._refreshing.discard(user_id)
+
+    def _schedule_refresh(self, collection, user_id: str):
+        if user_id in self._refreshing:
+            return
+        self._refreshing.add(user_id)
+        task = asyncio.create_task(self._refresh(collection, user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _get_index(self, collection, user_id: str) -> _UserIndex:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+            if time.monotonic() - index.built_at >= self.ttl_seconds:
+                self._schedule_refresh(collection, user_id)
+            return index
+
+        async with self._locks.setdefault(user_id, asyncio.Lock()):
+            index = self._indexes.get(user_id)
+            if index is None:
+                index = await self._build(collection, user_id)
+                self._store(user_id, index)
+            return index
+
+    async def search(self, collection, user_id: str, query: str, offset: int = 0, limit: int = 20) -> Tuple[int, List[Tuple[str, float]]]:
+        """Return (total matches, [(post_id, score), ...]) for one page of results"""
+        index = await self._get_index(collection, user_id)
+        return index.search(query, offset, limit)
+
+    def invalidate(self, user_id: Optional[str] = None):
+        if user_id is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(user_id, None)
+
+
+# Singleton instance
+search_index = PostSearchIndex()
@@ -1,12 +1,16 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, ReadPreference, ReturnDocument, UpdateOne
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
 import os
 import uuid
@@ -14,23 +18,34 @@ import asyncio
 from functools import lru_cache
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 from emergentintegrations.llm.openai.image_generation import OpenAIImageGeneration
-from pinterest_service import pinterest_service
+from pinterest_service import pinterest_service, media_source_from_post
+from http_cache import conditional_json, not_modified, version_etag
+from search_index import INDEX_PROJECTION, search_index
+from analytics_service import AnalyticsService
+from suggestion_index import suggestion_index
+from image_cache import image_cache, make_cache_key
+from dedup_index import DuplicateIndex, DEFAULT_SIMILARITY_THRESHOLD
+from thumbnails import ThumbnailService, THUMBNAIL_SIZES, THUMBNAIL_FORMATS
+from post_events import PostEventBroker
+from query_monitor import command_monitor, current_route
+from idempotency import IdempotencyStore, request_fingerprint
+from archive import MergedCursor, PostArchive
+from middleware import AdmissionMiddleware, CompressionMiddleware, RateLimitMiddleware, RequestContextMiddleware
+from admission import admission, within_deadline
+from ndjson import iter_request_items, stream_cursor, BulkBodyError, BulkLimitExceeded, NDJSON_MEDIA_TYPE
 import httpx
-import base64
 
 # Load environment variables
 load_dotenv()
 
-# Initialize FastAPI app
-app = FastAPI(title="Pinspire API")
-
-# Simple rate limiting - track requests per IP
-from collections import defaultdict, deque
-import time
+async def track_route(request: Request):
+    """Label Mongo commands issued while handling this request with its route template"""
+    route = request.scope.get("route")
+    current_route.set(f"{request.method} {route.path}" if route else request.url.path)
 
-request_tracker = defaultdict(lambda: deque(maxlen=500))  # Track last 500 requests per IP
-RATE_LIMIT_WINDOW = 60  # seconds
-MAX_REQUESTS_PER_WINDOW = 300  # Increased to 300 requests per minute
+# Initialize FastAPI app
+# ORJSONResponse serializes Mongo documents much faster than the stdlib json encoder
+app = FastAPI(title="Pinspire API", default_response_class=ORJSONResponse, dependencies=[Depends(track_route)])
 
 # Paths that should be excluded from rate limiting
 RATE_LIMIT_EXCLUDE_PATHS = [
@@ -40,45 +55,26 @@ RATE_LIMIT_EXCLUDE_PATHS = [
     "/api/pinterest/mode"  # Cached endpoint, no need to rate limit
 ]
 
-async def rate_limit_check(request):
-    """Simple rate limiting middleware"""
-    # Skip rate limiting for excluded paths
-    if request.url.path in RATE_LIMIT_EXCLUDE_PATHS:
-        return
-    
-    client_ip = request.client.host
-    current_time = time.time()
-    
-    # Clean old requests outside the window
-    while request_tracker[client_ip] and request_tracker[client_ip][0] < current_time - RATE_LIMIT_WINDOW:
-        request_tracker[client_ip].popleft()
-    
-    # Check if limit exceeded
-    if len(request_tracker[client_ip]) >= MAX_REQUESTS_PER_WINDOW:
-        raise HTTPException(
-            status_code=429,
-            detail=f"Rate limit exceeded. Maximum {MAX_REQUESTS_PER_WINDOW} requests per {RATE_LIMIT_WINDOW} seconds. Please slow down."
-        )
-    
-    # Add current request
-    request_tracker[client_ip].append(current_time)
-
-# Add rate limiting middleware
-@app.middleware("http")
-async def rate_limiting_middleware(request, call_next):
-    """Apply rate limiting to all requests"""
-    # Process the request first, then check rate limit
-    # This prevents interfering with response generation
-    try:
-        await rate_limit_check(request)
-        response = await call_next(request)
-        return response
-    except HTTPException as e:
-        from fastapi.responses import JSONResponse
-        return JSONResponse(
-            status_code=e.status_code,
-            content={"detail": e.detail}
-        )
+# Middleware is pure ASGI (see middleware.py); the last one added runs first.
+# Admission control: separate bounded pools per endpoint class so a backlog of
+# slow LLM/image/Pinterest calls can't starve ordinary CRUD; saturated pools shed with 503
+ADMISSION_CLASSES = [
+    ("/api/ai/generate-image", "image"),
+    ("/api/ai/", "llm"),
+    ("/api/pinterest/post/", "pinterest"),
+    ("/api/pinterest/boards", "pinterest"),
+    ("/api/pinterest/callback", "pinterest"),
+]
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=admission,
+    classes=ADMISSION_CLASSES,
+    default_pool="crud",
+    exclude_paths=["/api/events/posts"]  # Long-lived SSE streams would pin a slot each
+)
+
+# Per-IP rate limiting: 300 requests per minute
+app.add_middleware(RateLimitMiddleware, max_requests=300, window_seconds=60, exclude_paths=RATE_LIMIT_EXCLUDE_PATHS)
 
 # CORS configuration
 app.add_middleware(
@@ -87,19 +83,83 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Request-ID", "Server-Timing", "Idempotent-Replayed"],
 )
 
+# Negotiated gzip/brotli compression; images and already-encoded bodies pass through
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+# Request IDs and timing wrap everything else
+app.add_middleware(RequestContextMiddleware)
+
 # Database setup
 MONGO_URL = os.getenv("MONGO_URL")
-client = AsyncIOMotorClient(MONGO_URL)
+
+def env_int_options(**names: str) -> dict:
+    """Client options from the environment variables that are set, e.g. maxPoolSize=MONGO_MAX_POOL_SIZE"""
+    return {option: int(os.environ[name]) for option, name in names.items() if os.getenv(name)}
+
+def read_preference(name: str):
+    """'secondaryPreferred' etc.; MONGO_MAX_STALENESS_SECONDS bounds how far behind a secondary may be"""
+    mode = read_pref_mode_from_name(name)
+    # Staleness only applies to modes that may read from secondaries; primary rejects it
+    max_staleness = -1 if mode == ReadPreference.PRIMARY.mode else int(os.getenv("MONGO_MAX_STALENESS_SECONDS", "-1"))
+    return make_read_preference(mode, None, max_staleness)
+
+# Pool size and timeouts are per worker process; unset variables keep the driver defaults
+MONGO_CLIENT_OPTIONS = env_int_options(
+    maxPoolSize="MONGO_MAX_POOL_SIZE",
+    minPoolSize="MONGO_MIN_POOL_SIZE",
+    maxIdleTimeMS="MONGO_MAX_IDLE_TIME_MS",
+    waitQueueTimeoutMS="MONGO_WAIT_QUEUE_TIMEOUT_MS",
+    connectTimeoutMS="MONGO_CONNECT_TIMEOUT_MS",
+    socketTimeoutMS="MONGO_SOCKET_TIMEOUT_MS",
+    serverSelectionTimeoutMS="MONGO_SERVER_SELECTION_TIMEOUT_MS",
+)
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+# Listing and export reads can tolerate slight staleness, e.g. secondaryPreferred
+MONGO_LISTING_READ_PREFERENCE = os.getenv("MONGO_LISTING_READ_PREFERENCE", MONGO_READ_PREFERENCE)
+
+# command_monitor records per-query-shape timings and slow operations (see /api/admin/mongo)
+client = AsyncIOMotorClient(
+    MONGO_URL,
+    event_listeners=[command_monitor],
+    read_preference=read_preference(MONGO_READ_PREFERENCE),
+    **MONGO_CLIENT_OPTIONS
+)
 db = client.pinspire
+listing_posts = db.posts.with_options(read_preference=read_preference(MONGO_LISTING_READ_PREFERENCE))
+listing_archive = db.posts_archive.with_options(read_preference=read_preference(MONGO_LISTING_READ_PREFERENCE))
+analytics = AnalyticsService(db.post_stats, db.posts, db.posts_archive)
+duplicate_index = DuplicateIndex(db.post_signatures)
+# Change events carry the indexed fields so every worker's search index can follow them
+post_events = PostEventBroker(db.posts, db.post_deletions, document_fields=[*INDEX_PROJECTION, "tagged_topics"])
+idempotency = IdempotencyStore(db.idempotency_keys)
+# Published posts older than ARCHIVE_AFTER_DAYS move to posts_archive (see archive.py)
+post_archive = PostArchive(db.posts, db.posts_archive, db.job_leases, db.archive_blobs)
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+EVENTS_TOKEN_SCOPE = "post_events"
+EVENTS_TOKEN_TTL_SECONDS = 60
 EMERGENT_LLM_KEY = os.getenv("EMERGENT_LLM_KEY")
+thumbnail_service = ThumbnailService(db.post_thumbnails, db.posts, JWT_SECRET, post_archive)
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+# Hashtag suggestions are served from the local index when it has at least this many candidates
+MIN_LOCAL_HASHTAG_SUGGESTIONS = int(os.getenv("MIN_LOCAL_HASHTAG_SUGGESTIONS", "8"))
+
+# Bulk post endpoints: items per bulk_write round trip, and per request
+BULK_BATCH_SIZE = 1000
+MAX_BULK_ITEMS = int(os.getenv("MAX_BULK_ITEMS", "10000"))
+
+# Export cursor batch sizes: documents with inline images can be megabytes each
+EXPORT_BATCH_SIZE = 500
+EXPORT_INLINE_BATCH_SIZE = 20
+EXPORT_IMAGE_MODES = ("omit", "reference", "inline")
 
 # Pydantic Models
 class UserSignup(BaseModel):
@@ -121,6 +181,7 @@ class ImageGenerationRequest(BaseModel):
     size: Optional[str] = "1024x1024"  # Options: 1024x1024, 1792x1024, 1024x1792
     quality: Optional[str] = "standard"  # Options: standard, hd
     style: Optional[str] = "vivid"  # Options: natural, vivid
+    fresh: Optional[bool] = False  # Skip the image cache and generate a new variation
 
 class PostCreate(BaseModel):
     title: Optional[str] = ""
@@ -147,6 +208,43 @@ class PostUpdate(BaseModel):
     tagged_topics: Optional[List[str]] = []
     scheduled_time: Optional[str] = None
 
+# Response Models
+# These document the post endpoints in OpenAPI. Hot post routes return
+# ORJSONResponse directly, so FastAPI skips jsonable_encoder and per-field
+# validation of the (already trusted) Mongo documents.
+class PostOut(BaseModel):
+    id: str = Field(alias="_id")
+    user_id: str
+    title: str = ""
+    caption: str
+    description: str = ""
+    link_url: Optional[str] = None
+    image_url: Optional[str] = None
+    image_data: Optional[str] = None
+    boards: List[str] = []
+    suggested_boards: List[str] = []
+    tagged_topics: List[str] = []
+    scheduled_time: Optional[str] = None
+    status: str
+    ai_generated_caption: bool = False
+    ai_generated_image: bool = False
+    pinterest_post_id: Optional[str] = None
+    pinterest_post_ids: Optional[List[str]] = None
+    pinterest_boards_posted: Optional[List[str]] = None
+    created_at: str
+    updated_at: Optional[str] = None
+    published_at: Optional[str] = None
+    thumbnail_version: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    metadata: dict = {}
+
+class PostListResponse(BaseModel):
+    posts: List[PostOut]
+
+class PostResponse(BaseModel):
+    post: PostOut
+    message: Optional[str] = None
+
 class PinterestPostRequest(BaseModel):
     board_ids: List[str]
 
@@ -168,6 +266,164 @@ class PinterestCredentialsRequest(BaseModel):
     redirect_uri: str
 
 # Helper Functions
+def fast_json(content: dict, status_code: int = 200) -> ORJSONResponse:
+    """Return Mongo documents as-is, bypassing jsonable_encoder and response_model validation"""
+    return ORJSONResponse(content=content, status_code=status_code)
+
+# Listing projection: drop inline image payloads (image_data and data: image_url) and
+# flag posts that have one so a thumbnail URL can be returned instead ($substrCP: $substrBytes
+# errors when byte 5 falls inside a multi-byte character of a non-ASCII URL)
+_INLINE_IMAGE_URL = {"$eq": [{"$substrCP": [{"$ifNull": ["$image_url", ""]}, 0, 5]}, "data:"]}
+# image_url takes precedence over image_data, as in media_source_from_post
+_HAS_IMAGE_URL = {"$gt": [{"$strLenBytes": {"$ifNull": ["$image_url", ""]}}, 0]}
+POST_LISTING_PROJECTION = {
+    **{field: 1 for field in PostOut.model_fields if field not in ("id", "image_url", "image_data", "thumbnail_url")},
+    "image_url": {"$cond": [_INLINE_IMAGE_URL, None, "$image_url"]},
+    "has_inline_image": {"$cond": [
+        _HAS_IMAGE_URL,
+        _INLINE_IMAGE_URL,
+        {"$gt": [{"$strLenBytes": {"$ifNull": ["$image_data", ""]}}, 0]}
+    ]},
+}
+
+# Archived posts keep inline images as blob references (see archive.py)
+ARCHIVE_LISTING_PROJECTION = {
+    **POST_LISTING_PROJECTION,
+    "image_url": 1,
+    # A data: image_url is stored as a blob reference, leaving image_url empty
+    "has_inline_image": {"$and": [{"$not": [_HAS_IMAGE_URL]}, {"$gt": ["$archived_images", None]}]},
+}
+
+def with_thumbnail_urls(posts: List[dict]) -> List[dict]:
+    """Replace the inline-image flag from POST_LISTING_PROJECTION with a signed thumbnail URL"""
+    for post in posts:
+        if post.pop("has_inline_image", False):
+            post["thumbnail_url"] = thumbnail_service.url(post["_id"], post.get("thumbnail_version"))
+    return posts
+
+def build_post_document(post_data: PostCreate, user_id: str) -> dict:
+    return {
+        "_id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "title": post_data.title or "",
+        "caption": post_data.caption,
+        "description": post_data.description or "",
+        "link_url": post_data.link_url,
+        "image_url": post_data.image_url,
+        "image_data": post_data.image_data,
+        "boards": post_data.boards or [],
+        "suggested_boards": post_data.suggested_boards or [],
+        "tagged_topics": post_data.tagged_topics or [],
+        "scheduled_time": post_data.scheduled_time,
+        "status": "scheduled" if post_data.scheduled_time else "draft",
+        "ai_generated_caption": post_data.ai_generated_caption,
+        "ai_generated_image": post_data.ai_generated_image,
+        "pinterest_post_id": None,
+        "created_at": datetime.utcnow().isoformat(),
+        "published_at": None,
+        "metadata": {}
+    }
+
+def post_update_fields(post_data: PostUpdate) -> dict:
+    update_data = {k: v for k, v in post_data.dict().items() if v is not None}
+    update_data["updated_at"] = datetime.utcnow().isoformat()
+    return update_data
+
+def describe_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'item'}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+async def bulk_write_failures(collection, operations: list) -> Dict[int, str]:
+    """Run an unordered bulk_write; return {operation position: error} for the writes that failed"""
+    if not operations:
+        return {}
+    try:
+        await collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as error:
+        return {detail["index"]: detail.get("errmsg", "Write failed") for detail in error.details.get("writeErrors", [])}
+    return {}
+
+async def apply_bulk_side_effects(user_id: str, changes: List[Tuple[Optional[dict], Optional[dict]]]):
+    """Bring search, suggestions, duplicate signatures and analytics in line with a batch of (before, after) writes"""
+    removed_ids = []
+    deleted = []
+    for before, after in changes:
+        if after is None:
+            search_index.remove_post(user_id, before["_id"])
+            removed_ids.append(before["_id"])
+        else:
+            search_index.add_post(after)
+            if before is None and not post_events.change_streams:
+                suggestion_index.add_post(after)
+        if before is None:
+            post_events.publish("created", after)
+        elif after is None:
+            deleted.append(before)
+        else:
+            post_events.publish("updated", after, [key for key in after if before.get(key) != after.get(key)])
+    await post_events.publish_deleted(deleted)
+    await duplicate_index.upsert_many([after for _, after in changes if after is not None])
+    await duplicate_index.remove_many(removed_ids)
+    await analytics.record_changes(user_id, changes)
+
+async def run_bulk(
+    request: Request,
+    prepare: Callable[[Any], Any],
+    write_batch: Callable[[List[Tuple[int, Any]]], Awaitable[List[dict]]]
+) -> ORJSONResponse:
+    """
+    Validate bulk items one at a time and write them in batches of BULK_BATCH_SIZE.
+    Every item gets a result; invalid items are reported without failing the rest.
+    """
+    results = []
+    batch = []
+    truncated = None
+    try:
+        async for index, item, error in iter_request_items(request, MAX_BULK_ITEMS):
+            if error is None:
+                try:
+                    prepared = prepare(item)
+                except ValidationError as validation_error:
+                    error = describe_validation_error(validation_error)
+                except (TypeError, ValueError) as value_error:
+                    error = str(value_error)
+            if error is not None:
+                results.append({"index": index, "status": "error", "error": error})
+                continue
+            batch.append((index, prepared))
+            if len(batch) >= BULK_BATCH_SIZE:
+                results.extend(await write_batch(batch))
+                batch = []
+    except BulkLimitExceeded as error:
+        if not results and not batch:
+            raise HTTPException(status_code=413, detail=str(error))
+        # NDJSON stream ran past the limit: finish the items already read
+        truncated = str(error)
+    except BulkBodyError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    if batch:
+        results.extend(await write_batch(batch))
+
+    results.sort(key=lambda result: result["index"])
+    failed = sum(1 for result in results if result["status"] == "error")
+    response = {"results": results, "total": len(results), "succeeded": len(results) - failed, "failed": failed}
+    if truncated:
+        response["truncated"] = truncated
+    return fast_json(response)
+
+def bulk_item_object(item: Any) -> dict:
+    if not isinstance(item, dict):
+        raise TypeError("Each item must be a JSON object")
+    return item
+
+def bulk_item_id(item: Any) -> str:
+    post_id = item if isinstance(item, str) else bulk_item_object(item).get("id")
+    if not isinstance(post_id, str) or not post_id:
+        raise ValueError("Each item needs a post id")
+    return post_id
+
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -185,11 +441,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
+    return await user_from_token(credentials.credentials)
+
+async def user_from_token(token: str, scope: Optional[str] = None) -> dict:
+    """User a JWT belongs to; login tokens have no scope, narrower ones (e.g. the event stream's) only work where asked for"""
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         user_id: str = payload.get("sub")
-        if user_id is None:
+        if user_id is None or payload.get("scope") != scope:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
@@ -199,6 +458,55 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="User not found")
     return user
 
+async def get_admin_user(current_user: dict = Depends(get_current_user)):
+    if current_user.get("username") not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+@app.on_event("startup")
+async def ensure_indexes():
+    """Create the indexes the listing, suggestion and duplicate lookups rely on"""
+    await db.posts.create_index([("user_id", 1), ("created_at", -1)])
+    await db.post_thumbnails.create_index("user_id")
+    await db.vocabulary.create_index("user_id")
+    await duplicate_index.ensure_indexes()
+    await idempotency.ensure_indexes()
+    await post_archive.ensure_indexes()
+    await post_events.ensure_indexes()
+
+@app.on_event("startup")
+async def start_post_events():
+    post_events.add_listener(follow_post_changes)
+    post_events.start()
+
+def follow_post_changes(event_type: str, user_id: Optional[str], post: dict):
+    """Keep this worker's search indexes and suggestion tries in step with writes made by any worker"""
+    if event_type == "resync":
+        search_index.invalidate()
+        suggestion_index.invalidate()
+    elif event_type == "deleted":
+        search_index.remove_post(user_id, post["_id"])
+    else:
+        # Re-adding a post this worker already indexed just replaces it
+        search_index.add_post(post)
+        if event_type == "created":
+            suggestion_index.add_post(post)
+
+def forget_archived_posts(posts: List[dict]):
+    """Archived posts drop out of this worker's search index (search covers hot posts only)"""
+    for post in posts:
+        search_index.remove_post(post["user_id"], post["_id"])
+
+@app.on_event("startup")
+async def start_post_archive():
+    post_archive.start(forget_archived_posts)
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    thumbnail_service.shutdown()
+    await post_events.stop()
+    await post_archive.stop()
+
 # Routes
 @app.get("/")
 async def root():
@@ -263,13 +571,13 @@ async def login(user_data: UserLogin):
     }
 
 @app.get("/api/auth/me")
-async def get_me(current_user: dict = Depends(get_current_user)):
-    return {
+async def get_me(request: Request, current_user: dict = Depends(get_current_user)):
+    return conditional_json(request, {
         "id": current_user["_id"],
         "username": current_user["username"],
         "email": current_user["email"],
         "pinterest_connected": current_user.get("pinterest_connected", False)
-    }
+    })
 
 @app.put("/api/auth/update-profile")
 async def update_profile(request: UpdateProfileRequest, current_user: dict = Depends(get_current_user)):
@@ -381,7 +689,7 @@ Return ONLY a valid JSON object with these exact keys. Example format:
 Now generate for topic: {request.topic}"""
         
         user_message = UserMessage(text=prompt)
-        response = await chat.send_message(user_message)
+        response = await within_deadline(chat.send_message(user_message))
         
         # Parse JSON response
         import json
@@ -403,6 +711,14 @@ Now generate for topic: {request.topic}"""
                 "hashtags": [f"#{keyword}" for keyword in request.keywords[:5]] if request.keywords else []
             }
         
+        # Feed the generated vocabulary into local hashtag suggestions
+        await suggestion_index.record_generation(
+            db.vocabulary,
+            current_user["_id"],
+            content_data.get("tagged_topics", []),
+            content_data.get("hashtags", [])
+        )
+        
         return {
             "title": content_data.get("title", ""),
             "caption": content_data.get("caption", ""),
@@ -412,6 +728,8 @@ Now generate for topic: {request.topic}"""
             "hashtags": content_data.get("hashtags", []),
             "success": True
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating caption: {str(e)}")
 
@@ -433,22 +751,31 @@ async def generate_image(request: ImageGenerationRequest, current_user: dict = D
         if request.style not in valid_styles:
             raise HTTPException(status_code=400, detail=f"Invalid style. Must be one of: {', '.join(valid_styles)}")
         
-        # Initialize OpenAI Image Generation with Emergent LLM Key
-        image_gen = OpenAIImageGeneration(api_key=EMERGENT_LLM_KEY)
+        async def generate() -> bytes:
+            # Initialize OpenAI Image Generation with Emergent LLM Key
+            image_gen = OpenAIImageGeneration(api_key=EMERGENT_LLM_KEY)
+            
+            # Generate image using gpt-image-1 (latest DALL-E model)
+            # Note: The emergentintegrations library uses gpt-image-1 as the latest model
+            images = await within_deadline(image_gen.generate_images(
+                prompt=request.prompt,
+                model="gpt-image-1",
+                number_of_images=1
+            ))
+            
+            if not images or len(images) == 0:
+                raise HTTPException(status_code=500, detail="No image was generated")
+            return images[0]
         
-        # Generate image using gpt-image-1 (latest DALL-E model)
-        # Note: The emergentintegrations library uses gpt-image-1 as the latest model
-        images = await image_gen.generate_images(
-            prompt=request.prompt,
+        # Exact repeats of a prompt/size/quality/style combination are served from disk
+        cache_key = make_cache_key(
             model="gpt-image-1",
-            number_of_images=1
+            prompt=request.prompt,
+            size=request.size,
+            quality=request.quality,
+            style=request.style
         )
-        
-        if not images or len(images) == 0:
-            raise HTTPException(status_code=500, detail="No image was generated")
-        
-        # Convert image bytes to base64
-        image_base64 = base64.b64encode(images[0]).decode('utf-8')
+        image_base64, cache_hit = await image_cache.get_or_create(cache_key, generate, fresh=bool(request.fresh))
         image_data_url = f"data:image/png;base64,{image_base64}"
         
         return {
@@ -457,6 +784,7 @@ async def generate_image(request: ImageGenerationRequest, current_user: dict = D
             "size": request.size,
             "quality": request.quality,
             "style": request.style,
+            "cached": cache_hit,
             "success": True,
             "note": "Image generated with DALL-E (gpt-image-1) via Emergent LLM Key"
         }
@@ -468,6 +796,17 @@ async def generate_image(request: ImageGenerationRequest, current_user: dict = D
 @app.post("/api/ai/suggest-hashtags")
 async def suggest_hashtags(request: CaptionRequest, current_user: dict = Depends(get_current_user)):
     try:
+        # Serve from the user's own vocabulary when it is rich enough
+        local_hashtags = await suggestion_index.suggest_hashtags(
+            db.posts, db.vocabulary, current_user["_id"], request.topic
+        )
+        if len(local_hashtags) >= MIN_LOCAL_HASHTAG_SUGGESTIONS:
+            return {
+                "hashtags": local_hashtags,
+                "source": "local",
+                "success": True
+            }
+        
         chat = LlmChat(
             api_key=EMERGENT_LLM_KEY,
             session_id=f"hashtags-{uuid.uuid4()}",
@@ -478,82 +817,496 @@ async def suggest_hashtags(request: CaptionRequest, current_user: dict = Depends
         prompt += "Return only the hashtags, one per line, with the # symbol."
         
         user_message = UserMessage(text=prompt)
-        response = await chat.send_message(user_message)
+        response = await within_deadline(chat.send_message(user_message))
         
         # Parse hashtags from response
-        hashtags = [line.strip() for line in response.split('\n') if line.strip().startswith('#')]
+        llm_hashtags = [line.strip() for line in response.split('\n') if line.strip().startswith('#')]
+        await suggestion_index.record_generation(db.vocabulary, current_user["_id"], [], llm_hashtags)
+        
+        # Local matches first, then new LLM suggestions
+        seen = {hashtag.lower() for hashtag in local_hashtags}
+        hashtags = local_hashtags + [hashtag for hashtag in llm_hashtags if hashtag.lower() not in seen]
         
         return {
             "hashtags": hashtags,
+            "source": "mixed" if local_hashtags else "llm",
             "success": True
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error suggesting hashtags: {str(e)}")
 
+@app.get("/api/suggestions/topics")
+async def suggest_topics(
+    prefix: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=20),
+    current_user: dict = Depends(get_current_user)
+):
+    """Keystroke-level topic/hashtag autocomplete from the user's own vocabulary (no LLM call)"""
+    suggestions = await suggestion_index.suggest(db.posts, db.vocabulary, current_user["_id"], prefix, limit)
+    return {"suggestions": suggestions}
+
 # Post Management Routes
-@app.get("/api/posts")
-async def get_posts(current_user: dict = Depends(get_current_user)):
-    posts = await db.posts.find({"user_id": current_user["_id"]}).sort("created_at", -1).to_list(100)
-    return {"posts": posts}
+async def post_listing_etag(user_id: str) -> str:
+    """
+    ETag of a user's post listing from a version aggregate, so a 304 needs no posts loaded or serialized.
+
+    Every write to a listed field sets updated_at, created_at or published_at,
+    or (thumbnails) gives a post its thumbnail_version; deletes and archival
+    change the count.
+    """
+    versions = await listing_posts.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "created_at": {"$max": "$created_at"},
+            "updated_at": {"$max": "$updated_at"},
+            "published_at": {"$max": "$published_at"},
+            "thumbnails": {"$sum": {"$cond": [{"$gt": ["$thumbnail_version", None]}, 1, 0]}},
+        }},
+    ]).to_list(1)
+    version = versions[0] if versions else {}
+    return version_etag("posts", *(version.get(key) for key in ("count", "created_at", "updated_at", "published_at", "thumbnails")))
+
+@app.get("/api/posts", response_model=PostListResponse)
+async def get_posts(request: Request, current_user: dict = Depends(get_current_user)):
+    # Versioned before the read: a write in between leaves an older tag on newer posts, never the reverse
+    etag = await post_listing_etag(current_user["_id"])
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    posts = await listing_posts.find(
+        {"user_id": current_user["_id"]},
+        POST_LISTING_PROJECTION
+    ).sort("created_at", -1).to_list(100)
+    return conditional_json(request, {"posts": with_thumbnail_urls(posts)}, etag=etag)
 
 @app.post("/api/posts")
-async def create_post(post_data: PostCreate, current_user: dict = Depends(get_current_user)):
-    post_id = str(uuid.uuid4())
+async def create_post(
+    post_data: PostCreate,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    """Create a post; retries carrying the same Idempotency-Key get the original response"""
+    async def create():
+        post = build_post_document(post_data, current_user["_id"])
+        
+        # Look for near-duplicates before the new post is indexed itself
+        possible_duplicates = await duplicate_index.find_duplicates(post)
+        
+        await db.posts.insert_one(post)
+        search_index.add_post(post)
+        if not post_events.change_streams:
+            suggestion_index.add_post(post)  # Otherwise counted once, from the change stream
+        await duplicate_index.upsert(post)
+        await analytics.record_created(post)
+        thumbnail_service.schedule(post)
+        post_events.publish("created", post)
+        
+        return {"post": post, "possible_duplicates": possible_duplicates, "message": "Post created successfully"}
     
-    post = {
-        "_id": post_id,
-        "user_id": current_user["_id"],
-        "title": post_data.title or "",
-        "caption": post_data.caption,
-        "description": post_data.description or "",
-        "link_url": post_data.link_url,
-        "image_url": post_data.image_url,
-        "image_data": post_data.image_data,
-        "boards": post_data.boards or [],
-        "suggested_boards": post_data.suggested_boards or [],
-        "tagged_topics": post_data.tagged_topics or [],
-        "scheduled_time": post_data.scheduled_time,
-        "status": "scheduled" if post_data.scheduled_time else "draft",
-        "ai_generated_caption": post_data.ai_generated_caption,
-        "ai_generated_image": post_data.ai_generated_image,
-        "pinterest_post_id": None,
-        "created_at": datetime.utcnow().isoformat(),
-        "published_at": None,
-        "metadata": {}
-    }
+    return await idempotency.run(
+        idempotency_key, current_user["_id"], "create_post", request_fingerprint(post_data.dict()), create
+    )
+
+# Bulk post routes
+# Bodies are a JSON array, or NDJSON (Content-Type: application/x-ndjson) for imports
+# too large to buffer. Writes go out as unordered bulk_writes of BULK_BATCH_SIZE
+# and the response carries one result per item, in input order.
+@app.post("/api/posts/bulk")
+async def bulk_create_posts(request: Request, current_user: dict = Depends(get_current_user)):
+    """Create many posts; each item has the same fields as POST /api/posts"""
+    user_id = current_user["_id"]
+
+    def prepare(item: Any) -> dict:
+        return build_post_document(PostCreate(**bulk_item_object(item)), user_id)
+
+    async def write_batch(batch: List[Tuple[int, dict]]) -> List[dict]:
+        failures = await bulk_write_failures(db.posts, [InsertOne(post) for _, post in batch])
+        results, created = [], []
+        for position, (index, post) in enumerate(batch):
+            if position in failures:
+                results.append({"index": index, "status": "error", "error": failures[position]})
+            else:
+                results.append({"index": index, "id": post["_id"], "status": "created"})
+                created.append(post)
+        # Thumbnails are rendered on first request rather than queued for a whole import
+        await apply_bulk_side_effects(user_id, [(None, post) for post in created])
+        return results
+
+    return await run_bulk(request, prepare, write_batch)
+
+@app.put("/api/posts/bulk")
+async def bulk_update_posts(request: Request, current_user: dict = Depends(get_current_user)):
+    """Update many posts; each item is {"id": ..., <PUT /api/posts/{id} fields>}"""
+    user_id = current_user["_id"]
+
+    def prepare(item: Any) -> Tuple[str, dict]:
+        return bulk_item_id(item), post_update_fields(PostUpdate(**bulk_item_object(item)))
+
+    async def write_batch(batch: List[Tuple[int, Tuple[str, dict]]]) -> List[dict]:
+        post_ids = list({post_id for _, (post_id, _) in batch})
+        existing = {
+            post["_id"]: post
+            async for post in db.posts.find(
+                {"_id": {"$in": post_ids}, "user_id": user_id},
+                {"image_data": 0, "image_url": 0}
+            )
+        }
+        # Editing an archived post brings it back into the hot collection, as in update_post
+        for post_id in post_ids:
+            if post_id not in existing:
+                post = await post_archive.unarchive(post_id, user_id)
+                if post:
+                    post.pop("image_data", None)
+                    post.pop("image_url", None)
+                    existing[post_id] = post
+
+        results, operations, pending = [], [], []
+        for index, (post_id, update_data) in batch:
+            if post_id not in existing:
+                results.append({"index": index, "id": post_id, "status": "error", "error": "Post not found"})
+                continue
+            if "image_url" in update_data:
+                update_data["thumbnail_version"] = None
+            operations.append(UpdateOne({"_id": post_id, "user_id": user_id}, {"$set": update_data}))
+            pending.append((index, post_id, update_data))
+
+        failures = await bulk_write_failures(db.posts, operations)
+        changes, image_changed = [], []
+        for position, (index, post_id, update_data) in enumerate(pending):
+            if position in failures:
+                results.append({"index": index, "id": post_id, "status": "error", "error": failures[position]})
+                continue
+            before = existing[post_id]
+            after = existing[post_id] = {**before, **update_data}
+            changes.append((before, after))
+            if "image_url" in update_data:
+                image_changed.append(post_id)
+            results.append({"index": index, "id": post_id, "status": "updated"})
+
+        await apply_bulk_side_effects(user_id, changes)
+        await thumbnail_service.delete_many(image_changed)
+        return results
+
+    return await run_bulk(request, prepare, write_batch)
+
+@app.post("/api/posts/bulk-delete")
+async def bulk_delete_posts(request: Request, current_user: dict = Depends(get_current_user)):
+    """Delete many posts; each item is a post id or {"id": ...}"""
+    user_id = current_user["_id"]
+
+    async def write_batch(batch: List[Tuple[int, str]]) -> List[dict]:
+        found = {
+            post["_id"]: post
+            async for post in db.posts.find(
+                {"_id": {"$in": list({post_id for _, post_id in batch})}, "user_id": user_id},
+                {"image_data": 0, "image_url": 0}
+            )
+        }
+        if found:
+            await db.posts.delete_many({"_id": {"$in": list(found)}, "user_id": user_id})
+        missing = list({post_id for _, post_id in batch if post_id not in found})
+        for post in await post_archive.delete_many(missing, user_id):
+            found[post["_id"]] = post
+
+        results, deleted = [], []
+        for index, post_id in batch:
+            post = found.pop(post_id, None)
+            if post is None:
+                results.append({"index": index, "id": post_id, "status": "error", "error": "Post not found"})
+            else:
+                results.append({"index": index, "id": post_id, "status": "deleted"})
+                deleted.append(post)
+
+        await apply_bulk_side_effects(user_id, [(post, None) for post in deleted])
+        await thumbnail_service.delete_many([post["_id"] for post in deleted])
+        return results
+
+    return await run_bulk(request, bulk_item_id, write_batch)
+
+@app.get("/api/posts/search")
+async def search_posts(
+    q: str = Query(..., min_length=1, max_length=200),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """Ranked full-text search over title, caption, description and tagged topics (prefix matches included)"""
+    total, ranked = await search_index.search(db.posts, current_user["_id"], q, offset, limit)
     
-    await db.posts.insert_one(post)
+    posts = []
+    if ranked:
+        post_ids = [post_id for post_id, _ in ranked]
+        # Hydrated from the primary, like the index itself: a lagging secondary would drop fresh hits from the page
+        found = await db.posts.find(
+            {"_id": {"$in": post_ids}, "user_id": current_user["_id"]},
+            POST_LISTING_PROJECTION
+        ).to_list(len(post_ids))
+        with_thumbnail_urls(found)
+        by_id = {post["_id"]: post for post in found}
+        for post_id, score in ranked:
+            post = by_id.get(post_id)
+            if post:
+                post["score"] = round(score, 4)
+                posts.append(post)
     
-    return {"post": post, "message": "Post created successfully"}
+    return fast_json({
+        "posts": posts,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "query": q
+    })
 
-@app.get("/api/posts/{post_id}")
+@app.get("/api/posts/export")
+async def export_posts(
+    post_status: Optional[str] = Query(None, alias="status", pattern="^(draft|scheduled|published)$"),
+    created_from: Optional[str] = Query(None, alias="from"),
+    created_to: Optional[str] = Query(None, alias="to"),
+    images: str = Query("reference"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Stream every post of the account as NDJSON, oldest first.
+
+    `from`/`to` bound created_at (ISO dates or timestamps, inclusive). `images`
+    controls inline image payloads: `omit` drops them, `reference` (default)
+    replaces them with a thumbnail URL and the post URL that returns the full
+    image, `inline` exports them as stored.
+    """
+    if images not in EXPORT_IMAGE_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid images mode. Must be one of: {', '.join(EXPORT_IMAGE_MODES)}")
+    
+    query = {"user_id": current_user["_id"]}
+    if post_status:
+        query["status"] = post_status
+    created_range = {}
+    for operator, value in (("$gte", created_from), ("$lte", created_to)):
+        if not value:
+            continue
+        try:
+            bound = datetime.fromisoformat(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+        if operator == "$lte" and len(value) == 10:
+            bound += timedelta(days=1) - timedelta(microseconds=1)  # A bare date includes the whole day
+        created_range[operator] = bound.isoformat()
+    if created_range:
+        query["created_at"] = created_range
+    
+    # Archived posts are merged in by created_at; both collections have a (user_id, created_at) index
+    if images == "inline":
+        cursor = MergedCursor(
+            "created_at",
+            listing_posts.find(query).sort("created_at", 1).batch_size(EXPORT_INLINE_BATCH_SIZE),
+            post_archive.iter_restored(
+                listing_archive.find(query).sort("created_at", 1).batch_size(EXPORT_INLINE_BATCH_SIZE)
+            )
+        )
+        transform = None
+    else:
+        cursor = MergedCursor(
+            "created_at",
+            listing_posts.find(query, POST_LISTING_PROJECTION).sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE),
+            listing_archive.find(query, ARCHIVE_LISTING_PROJECTION).sort("created_at", 1).batch_size(EXPORT_BATCH_SIZE)
+        )
+        
+        def transform(post: dict) -> dict:
+            if post.pop("has_inline_image", False) and images == "reference":
+                post["thumbnail_url"] = thumbnail_service.url(post["_id"], post.get("thumbnail_version"))
+                post["image_ref"] = f"/api/posts/{post['_id']}"
+            return post
+    
+    filename = f"pinspire-posts-{datetime.utcnow().strftime('%Y%m%d')}.ndjson"
+    return StreamingResponse(
+        stream_cursor(cursor, transform),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/posts/{post_id}", response_model=PostResponse)
 async def get_post(post_id: str, current_user: dict = Depends(get_current_user)):
     post = await db.posts.find_one({"_id": post_id, "user_id": current_user["_id"]})
+    if not post:
+        post = await post_archive.find(post_id, current_user["_id"])
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    return {"post": post}
+    return fast_json({"post": post})
+
+@app.get("/api/posts/{post_id}/duplicates")
+async def get_post_duplicates(
+    post_id: str,
+    threshold: float = Query(DEFAULT_SIMILARITY_THRESHOLD, ge=0.1, le=1.0),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: dict = Depends(get_current_user)
+):
+    """Likely near-duplicates of a post (same caption/description/topics with small edits)"""
+    projection = {"user_id": 1, "caption": 1, "description": 1, "tagged_topics": 1}
+    post = (
+        await db.posts.find_one({"_id": post_id, "user_id": current_user["_id"]}, projection)
+        or await post_archive.find(post_id, current_user["_id"], projection)
+    )
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
+    
+    duplicates = await duplicate_index.find_duplicates(post, threshold=threshold, limit=limit)
+    return {"post_id": post_id, "duplicates": duplicates}
 
-@app.put("/api/posts/{post_id}")
+@app.get("/api/posts/{post_id}/thumbnail")
+async def get_post_thumbnail(
+    post_id: str,
+    request: Request,
+    sig: str = Query(...),
+    size: str = Query("card"),
+    v: Optional[str] = Query(None)
+):
+    """Serve a WebP/JPEG thumbnail of a post's inline image (signed URL, no bearer token)"""
+    if not thumbnail_service.verify(post_id, sig):
+        raise HTTPException(status_code=403, detail="Invalid thumbnail signature")
+    if size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"Invalid size. Must be one of: {', '.join(THUMBNAIL_SIZES)}")
+    
+    fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    result = await thumbnail_service.get(post_id, size, fmt)
+    if not result:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    data, version = result
+    
+    etag = f'"{version}-{size}-{fmt}"'
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept",
+        # Versioned URLs never change content; unversioned ones are revalidated
+        "Cache-Control": "public, max-age=31536000, immutable" if v == version else "public, max-age=60",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=THUMBNAIL_FORMATS[fmt], headers=headers)
+
+@app.put("/api/posts/{post_id}", response_model=PostResponse)
 async def update_post(post_id: str, post_data: PostUpdate, current_user: dict = Depends(get_current_user)):
-    post = await db.posts.find_one({"_id": post_id, "user_id": current_user["_id"]})
+    post = await db.posts.find_one({"_id": post_id, "user_id": current_user["_id"]}, {"_id": 1})
+    if not post:
+        # Editing an archived post brings it back into the hot collection
+        post = await post_archive.unarchive(post_id, current_user["_id"])
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    update_data = {k: v for k, v in post_data.dict().items() if v is not None}
-    update_data["updated_at"] = datetime.utcnow().isoformat()
+    update_data = post_update_fields(post_data)
     
-    await db.posts.update_one({"_id": post_id}, {"$set": update_data})
+    # The document as this write found it, so concurrent edits each count only their own change
+    post = await db.posts.find_one_and_update(
+        {"_id": post_id, "user_id": current_user["_id"]},
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
     
-    updated_post = await db.posts.find_one({"_id": post_id})
-    return {"post": updated_post, "message": "Post updated successfully"}
+    updated_post = {**post, **update_data}
+    search_index.add_post(updated_post)
+    await duplicate_index.upsert(updated_post)
+    await analytics.record_updated(post, updated_post)
+    if "image_url" in update_data:
+        thumbnail_service.schedule(updated_post)
+    post_events.publish("updated", updated_post, update_data.keys())
+    return fast_json({"post": updated_post, "message": "Post updated successfully"})
 
 @app.delete("/api/posts/{post_id}")
 async def delete_post(post_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.posts.delete_one({"_id": post_id, "user_id": current_user["_id"]})
-    if result.deleted_count == 0:
+    deleted_post = await db.posts.find_one_and_delete(
+        {"_id": post_id, "user_id": current_user["_id"]},
+        projection={"image_data": 0, "image_url": 0}
+    )
+    if not deleted_post:
+        deleted_post = await post_archive.delete(post_id, current_user["_id"])
+    if not deleted_post:
         raise HTTPException(status_code=404, detail="Post not found")
+    search_index.remove_post(current_user["_id"], post_id)
+    await duplicate_index.remove(post_id)
+    await thumbnail_service.delete(post_id)
+    await analytics.record_deleted(deleted_post)
+    await post_events.publish_deleted([deleted_post])
     return {"message": "Post deleted successfully"}
 
+@app.post("/api/events/token")
+async def create_post_events_token(current_user: dict = Depends(get_current_user)):
+    """
+    Short-lived token for opening the post event stream. EventSource can't send an
+    Authorization header, so this token goes in the URL (and thus access logs) instead
+    of the login JWT; it only opens event streams and expires within a minute.
+    """
+    token = create_access_token(
+        {"sub": current_user["_id"], "scope": EVENTS_TOKEN_SCOPE},
+        timedelta(seconds=EVENTS_TOKEN_TTL_SECONDS)
+    )
+    return {"token": token, "expires_in": EVENTS_TOKEN_TTL_SECONDS}
+
+@app.get("/api/events/posts")
+async def stream_post_events(token: str = Query(...)):
+    """
+    Server-sent events for the current user's posts (post.created / post.updated /
+    post.deleted, plus post.resync when a slow client missed events).
+    ?token= is a token from POST /api/events/token; login JWTs are rejected.
+    """
+    current_user = await user_from_token(token, scope=EVENTS_TOKEN_SCOPE)
+    return StreamingResponse(
+        post_events.stream(current_user["_id"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Admin Routes
+@app.get("/api/admin/image-cache")
+async def get_image_cache_stats(current_user: dict = Depends(get_admin_user)):
+    """Hit/miss/eviction counters and size of the generated image cache"""
+    return image_cache.stats()
+
+@app.get("/api/admin/mongo")
+async def get_mongo_command_stats(
+    limit: int = Query(20, ge=1, le=200),
+    current_user: dict = Depends(get_admin_user)
+):
+    """Top query shapes by cumulative time (with the routes issuing them) and recent slow operations"""
+    return fast_json(command_monitor.report(limit))
+
+@app.delete("/api/admin/mongo")
+async def reset_mongo_command_stats(current_user: dict = Depends(get_admin_user)):
+    command_monitor.reset()
+    return {"message": "Mongo command statistics reset"}
+
+@app.get("/api/admin/admission")
+async def get_admission_stats(current_user: dict = Depends(get_admin_user)):
+    """Running/queued/shed counts and limits of each admission pool"""
+    return admission.stats()
+
+@app.get("/api/admin/archive")
+async def get_archive_stats(current_user: dict = Depends(get_admin_user)):
+    """Settings and progress of the published-post archival job"""
+    return post_archive.stats()
+
+@app.post("/api/admin/archive/run")
+async def run_post_archive(current_user: dict = Depends(get_admin_user)):
+    """Archive every post that is due now instead of waiting for the next scheduled run"""
+    archived = await post_archive.archive_due(forget_archived_posts)
+    return {"message": f"Archived {archived} posts", "archived": archived}
+
+@app.post("/api/admin/duplicates/backfill")
+async def backfill_duplicate_signatures(current_user: dict = Depends(get_admin_user)):
+    """Compute MinHash signatures for posts created before duplicate detection existed"""
+    written = await duplicate_index.backfill(db.posts)
+    return {"success": True, "signatures_written": written}
+
+# Analytics Routes
+@app.get("/api/analytics/dashboard")
+async def get_dashboard_analytics(request: Request, current_user: dict = Depends(get_current_user)):
+    """Post counts by status, AI usage ratios and per-day/per-board activity from materialized counters"""
+    stats = await analytics.get_dashboard(current_user["_id"])
+    return conditional_json(request, stats)
+
 # Pinterest Integration Routes
 
 @app.get("/api/pinterest/credentials")
@@ -744,7 +1497,7 @@ async def disconnect_pinterest(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=f"Error disconnecting Pinterest: {str(e)}")
 
 @app.get("/api/pinterest/boards")
-async def get_pinterest_boards(current_user: dict = Depends(get_current_user)):
+async def get_pinterest_boards(request: Request, current_user: dict = Depends(get_current_user)):
     """Fetch user's Pinterest boards"""
     if not current_user.get("pinterest_connected"):
         raise HTTPException(status_code=400, detail="Pinterest not connected. Please connect your Pinterest account first.")
@@ -775,63 +1528,111 @@ async def get_pinterest_boards(current_user: dict = Depends(get_current_user)):
         # Fetch boards
         boards = await pinterest_service.get_user_boards(access_token)
         
-        return {
+        return conditional_json(request, {
             "boards": boards,
             "is_mock": pinterest_service.is_mock
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching boards: {str(e)}")
 
 @app.post("/api/pinterest/post/{post_id}")
-async def post_to_pinterest(post_id: str, request: PinterestPostRequest, current_user: dict = Depends(get_current_user)):
-    """Post a pin to Pinterest board(s)"""
+async def post_to_pinterest(
+    post_id: str,
+    request: PinterestPostRequest,
+    current_user: dict = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None)
+):
+    """Post a pin to Pinterest board(s); retries carrying the same Idempotency-Key never create pins twice"""
     if not current_user.get("pinterest_connected"):
         raise HTTPException(status_code=400, detail="Pinterest not connected")
     
-    try:
-        # Get post
-        post = await db.posts.find_one({"_id": post_id, "user_id": current_user["_id"]})
-        if not post:
-            raise HTTPException(status_code=404, detail="Post not found")
+    async def publish():
+        try:
+            # Get post
+            post = await db.posts.find_one({"_id": post_id, "user_id": current_user["_id"]})
+            if not post:
+                # Republishing an archived post brings it back into the hot collection
+                post = await post_archive.unarchive(post_id, current_user["_id"])
+            if not post:
+                raise HTTPException(status_code=404, detail="Post not found")
         
-        if not post.get("image_url"):
-            raise HTTPException(status_code=400, detail="Post must have an image to post to Pinterest")
+            # Hosted image URL, data: URL or inline base64 image_data
+            try:
+                media_source = media_source_from_post(post.get("image_url"), post.get("image_data"))
+            except ValueError as error:
+                raise HTTPException(status_code=400, detail=str(error))
+            if not media_source:
+                raise HTTPException(status_code=400, detail="Post must have an image to post to Pinterest")
         
-        access_token = current_user.get("pinterest_access_token")
+            access_token = current_user.get("pinterest_access_token")
         
-        # Create pins on selected boards
-        pin_ids = []
-        for board_id in request.board_ids:
-            pin_result = await pinterest_service.create_pin(
+            # Pins already created by an earlier attempt with this Idempotency-Key (which failed
+            # on a later board) are kept on the post, so a retry only creates the missing ones
+            completed = {}
+            if idempotency_key:
+                progress = post.get("pinterest_publish_progress") or {}
+                if progress.get("key") == idempotency_key:
+                    completed = {pin["board_id"]: {"id": pin["id"]} for pin in progress.get("pins", [])}
+                else:
+                    await db.posts.update_one(
+                        {"_id": post_id},
+                        {"$set": {"pinterest_publish_progress": {"key": idempotency_key, "pins": []}}}
+                    )
+            
+            async def record_pin(board_id: str, pin: dict):
+                if idempotency_key:
+                    await db.posts.update_one(
+                        {"_id": post_id},
+                        {"$push": {"pinterest_publish_progress.pins": {"board_id": board_id, "id": pin.get("id")}}}
+                    )
+        
+            # Create pins on selected boards (inline images are uploaded once and reused)
+            pin_results = await pinterest_service.publish_pin(
                 access_token=access_token,
-                board_id=board_id,
+                board_ids=request.board_ids,
                 title=post.get("caption", "")[:100],  # Pinterest title limit
                 description=post.get("caption", ""),
-                image_url=post.get("image_url"),
-                link=None
+                link=None,
+                completed=completed,
+                on_pin=record_pin,
+                **media_source
             )
-            pin_ids.append(pin_result.get("id"))
+            pin_ids = [pin_result.get("id") for pin_result in pin_results]
         
-        # Update post status
-        await db.posts.update_one(
-            {"_id": post_id},
-            {"$set": {
+            # Update post status
+            publish_update = {
                 "status": "published",
                 "published_at": datetime.utcnow().isoformat(),
                 "pinterest_post_ids": pin_ids,
                 "pinterest_boards_posted": request.board_ids
-            }}
-        )
+            }
+            # Only applies if no other publish finished since the post was read, so one request makes the transition
+            before = await db.posts.find_one_and_update(
+                {"_id": post_id, "status": post.get("status"), "published_at": post.get("published_at")},
+                {"$set": publish_update, "$unset": {"pinterest_publish_progress": ""}},
+                return_document=ReturnDocument.BEFORE
+            )
+            if not before:
+                raise HTTPException(status_code=409, detail="Post was published or changed by another request")
+            await analytics.record_updated(before, {**before, **publish_update})
+            post_events.publish("updated", {**before, **publish_update}, publish_update.keys())
         
-        return {
-            "success": True,
-            "message": f"Post published to {len(request.board_ids)} board(s) successfully",
-            "pin_ids": pin_ids,
-            "is_mock": pinterest_service.is_mock
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error posting to Pinterest: {str(e)}")
+            return {
+                "success": True,
+                "message": f"Post published to {len(request.board_ids)} board(s) successfully",
+                "pin_ids": pin_ids,
+                "is_mock": pinterest_service.is_mock
+            }
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error posting to Pinterest: {str(e)}")
+    
+    return await idempotency.run(
+        idempotency_key, current_user["_id"], "post_to_pinterest", request_fingerprint(post_id, request.dict()), publish
+    )
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    # Workers, event loop, HTTP parser and shutdown draining come from the environment (see launcher.py)
+    from launcher import run
+    run()
\ No newline at end of file
@@ -0,0 +1,214 @@
+"""
+Local topic and hashtag autocomplete
+Frequency-weighted prefix tries built from a user's posts and past AI generations
+"""
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+TOP_K = 20  # Ranked completions cached at every trie node
+SUGGESTION_INDEX_MAX_USERS = int(os.getenv("SUGGESTION_INDEX_MAX_USERS", "512"))
+SUGGESTION_INDEX_TTL_SECONDS = int(os.getenv("SUGGESTION_INDEX_TTL_SECONDS", "600"))
+
+_WHITESPACE = re.compile(r"\s+")
+_NON_WORD = re.compile(r"[^\w\s]", re.UNICODE)
+
+
+def normalize(term: str) -> str:
+    """Lookup key for a topic or hashtag: lowercase, no '#', single spaces"""
+    return _WHITESPACE.sub(" ", term.replace("#", " ").lower()).strip()
+
+
+def to_hashtag(term: str) -> str:
+    """'quick recipes' -> '#QuickRecipes'; hashtags are returned unchanged"""
+    if term.startswith("#"):
+        return term
+    words = _NON_WORD.sub(" ", term.replace("'", "")).split()
+    return "#" + "".join(word[:1].upper() + word[1:] for word in words) if words else ""
+
+
+class _TrieNode:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.top: List[Tuple[int, str]] = []  # (count, entry key), best first
+
+
+class _Entry:
+    __slots__ = ("key", "display", "kind", "count")
+
+    def __init__(self, key: str, display: str, kind: str):
+        self.key = key
+        self.display = display
+        self.kind = kind
+        self.count = 0
+
+
+class _UserTrie:
+    """Prefix trie whose nodes cache their TOP_K most frequent completions"""
+
+    def __init__(self):
+        self.root = _TrieNode()
+        self.entries: Dict[str, _Entry] = {}
+        self.built_at = time.monotonic()
+
+    def add(self, term: str, kind: str, count: int = 1):
+        key = normalize(term)
+        if not key or count <= 0:
+            return
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = _Entry(key, term.strip(), kind)
+        elif kind == "hashtag" and entry.kind != "hashtag":
+            # Prefer the user's own hashtag spelling over a generated CamelCase one
+            entry.display, entry.kind = term.strip(), kind
+        entry.count += count
+
+        # Every word start is a completion point, so "recipes" finds "quick recipes"
+        words = key.split(" ")
+        for start in range(len(words)):
+            self._update_path(" ".join(words[start:]), entry)
+
+    def _update_path(self, path: str, entry: _Entry):
+        node = self.root
+        for char in path:
+            node = node.children.setdefault(char, _TrieNode())
+            top = [item for item in node.top if item[1] != entry.key]
+            if len(top) < TOP_K or entry.count > top[-1][0]:
+                top.append((entry.count, entry.key))
+                top.sort(key=lambda item: -item[0])
+                del top[TOP_K:]
+            node.top = top
+
+    def complete(self, prefix: str, limit: int) -> List[_Entry]:
+        node = self.root
+        for char in normalize(prefix):
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return [self.entries[key] for _, key in node.top[:limit]]
+
+
+class SuggestionIndex:
+    """
+    Per-user tries for recently active users.
+
+    A trie is built on first use from the user's post `tagged_topics` and the
+    `vocabulary` collection, which records hashtags and topics returned by
+    past AI generations. New posts and generations update it in place.
+    """
+
+    def __init__(self, max_users: int = SUGGESTION_INDEX_MAX_USERS, ttl_seconds: int = SUGGESTION_INDEX_TTL_SECONDS):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._tries: "OrderedDict[str, _UserTrie]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def _build(self, posts_collection, vocabulary_collection, user_id: str) -> _UserTrie:
+        trie = _UserTrie()
+        topics = posts_collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$project": {"tagged_topics": 1}},
+            {"$unwind": "$tagged_topics"},
+            {"$group": {"_id": "$tagged_topics", "count": {"$sum": 1}}},
+        ])
+        async for row in topics:
+            if isinstance(row["_id"], str):
+                trie.add(row["_id"], "topic", row["count"])
+        async for row in vocabulary_collection.find({"user_id": user_id}, {"term": 1, "kind": 1, "count": 1}):
+            trie.add(row["term"], row["kind"], row.get("count", 1))
+        return trie
+
+    async def _get_trie(self, posts_collection, vocabulary_collection, user_id: str) -> _UserTrie:
+        trie = self._tries.get(user_id)
+        if trie is not None and time.monotonic() - trie.built_at < self.ttl_seconds:
+            self._tries.move_to_end(user_id)
+            return trie
+
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            trie = self._tries.get(user_id)
+            if trie is None or time.monotonic() - trie.built_at >= self.ttl_seconds:
+                trie = await self._build(posts_collection, vocabulary_collection, user_id)
+                self._tries[user_id] = trie
+            self._tries.move_to_end(user_id)
+            while len(self._tries) > self.max_users:
+                evicted_user, _ = self._tries.popitem(last=False)
+                self._locks.pop(evicted_user, None)
+            return trie
+
+    def add_post(self, post: Dict):
+        """Count a new post's topics (no-op until the user's trie is loaded)"""
+        trie = self._tries.get(post.get("user_id"))
+        if trie is not None:
+            for topic in post.get("tagged_topics") or []:
+                trie.add(topic, "topic")
+
+    async def record_generation(self, vocabulary_collection, user_id: str, topics: List[str], hashtags: List[str]):
+        """Persist terms returned by the LLM so future suggestions can be served locally"""
+        terms = [(topic, "topic") for topic in topics if isinstance(topic, str)]
+        terms += [(hashtag, "hashtag") for hashtag in hashtags if isinstance(hashtag, str)]
+        operations = []
+        for term, kind in terms:
+            key = normalize(term)
+            if not key:
+                continue
+            operations.append(UpdateOne(
+                {"_id": f"{user_id}:{kind}:{key}"},
+                {"$inc": {"count": 1}, "$setOnInsert": {"user_id": user_id, "kind": kind, "term": term.strip()}},
+                upsert=True
+            ))
+        if operations:
+            await vocabulary_collection.bulk_write(operations, ordered=False)
+
+        trie = self._tries.get(user_id)
+        if trie is not None:
+            for term, kind in terms:
+                trie.add(term, kind)
+
+    async def suggest(self, posts_collection, vocabulary_collection, user_id: str, prefix: str, limit: int = 10) -> List[Dict]:
+        """Most frequent topics/hashtags starting with a prefix"""
+        trie = await self._get_trie(posts_collection, vocabulary_collection, user_id)
+        return [
+            {"term": entry.display, "kind": entry.kind, "count": entry.count}
+            for entry in trie.complete(prefix, limit)
+        ]
+
+    async def suggest_hashtags(self, posts_collection, vocabulary_collection, user_id: str, topic: str, limit: int = 15) -> List[str]:
+        """Hashtags for a free-text topic: whole-phrase completions first, then per-word completions"""
+        trie = await self._get_trie(posts_collection, vocabulary_collection, user_id)
+        scores: Dict[str, Tuple[float, str]] = {}
+
+        def collect(entries: List[_Entry], boost: float):
+            for entry in entries:
+                hashtag = to_hashtag(entry.display)
+                if not hashtag:
+                    continue
+                tag_key = hashtag.lower()
+                score = entry.count * boost
+                if tag_key not in scores or scores[tag_key][0] < score:
+                    scores[tag_key] = (score, hashtag)
+
+        collect(trie.complete(topic, TOP_K), 2.0)
+        for word in normalize(topic).split(" "):
+            if len(word) >= 3:
+                collect(trie.complete(word, TOP_K), 1.0)
+
+        ranked = sorted(scores.values(), key=lambda item: -item[0])
+        return [hashtag for _, hashtag in ranked[:limit]]
+
+    def invalidate(self, user_id: Optional[str] = None):
+        if user_id is None:
+            self._tries.clear()
+        else:
+            self._tries.pop(user_id, None)
+
+
+# Singleton instance
+suggestion_index = SuggestionIndex()
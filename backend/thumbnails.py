@@ -0,0 +1,247 @@
+"""
+Thumbnail derivatives for post images
+Renders WebP/JPEG thumbnails in a process pool, stores them in Mongo and serves them from a bounded memory cache
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import io
+import os
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from bson import Binary
+
+from pinterest_service import media_source_from_post
+
+# Maximum width per derivative; height follows the aspect ratio
+THUMBNAIL_SIZES = {
+    "card": 400,   # Dashboard post cards
+    "small": 160,  # Board selector and compact lists
+}
+THUMBNAIL_FORMATS = {
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+THUMBNAIL_QUALITY = 78
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", str(min(2, os.cpu_count() or 1))))
+THUMBNAIL_MEMORY_CACHE_BYTES = int(os.getenv("THUMBNAIL_MEMORY_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+
+def _render_derivatives(image_bytes: bytes) -> Dict[str, Dict]:
+    """Runs in a worker process: decode once, emit every size in every format"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        source.load()
+        if source.mode not in ("RGB", "RGBA"):
+            source = source.convert("RGBA" if "transparency" in source.info else "RGB")
+
+        derivatives = {}
+        for size, width in THUMBNAIL_SIZES.items():
+            image = source.copy()
+            image.thumbnail((width, width * 4), Image.LANCZOS)
+
+            webp = io.BytesIO()
+            image.save(webp, "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+
+            # JPEG has no alpha channel; flatten onto white
+            if image.mode == "RGBA":
+                flattened = Image.new("RGB", image.size, (255, 255, 255))
+                flattened.paste(image, mask=image.getchannel("A"))
+                image = flattened
+            jpeg = io.BytesIO()
+            image.save(jpeg, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+
+            derivatives[size] = {
+                "width": image.width,
+                "height": image.height,
+                "webp": webp.getvalue(),
+                "jpeg": jpeg.getvalue(),
+            }
+        return derivatives
+
+
+def inline_image_base64(post: Dict) -> Optional[str]:
+    """
+    Base64 payload of the image a post is pinned with, if it is inline.
+
+    Uses media_source_from_post, so the thumbnail always shows the image that
+    gets published; raises ValueError for inline images that aren't valid base64.
+    """
+    source = media_source_from_post(post.get("image_url"), post.get("image_data"))
+    return source.get("image_base64") if source else None
+
+
+class ThumbnailService:
+    """
+    Derivative pipeline for inline post images.
+
+    One `post_thumbnails` document per post holds every size/format. Its
+    version is a hash of the source image, so thumbnail URLs can be cached
+    immutably by browsers and change whenever the image does. An image that
+    fails to render is stored as a `failed` document for its version, so it
+    is served as a 404 instead of being re-rendered on every request.
+    """
+
+    def __init__(self, collection, posts_collection, secret: str, archive=None):
+        self.collection = collection
+        self.posts = posts_collection
+        self.archive = archive  # PostArchive: source of archived posts' images
+        self._secret = (secret or "").encode("utf-8")
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._memory: "OrderedDict[Tuple[str, str, str, str], bytes]" = OrderedDict()
+        self._memory_bytes = 0
+
+    # URLs
+
+    def signature(self, post_id: str) -> str:
+        """Thumbnail URLs are loaded by <img> tags, which can't send a bearer token"""
+        return hmac.new(self._secret, f"thumbnail:{post_id}".encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+    def verify(self, post_id: str, signature: str) -> bool:
+        return hmac.compare_digest(self.signature(post_id), signature or "")
+
+    def url(self, post_id: str, version: Optional[str], size: str = "card") -> str:
+        return f"/api/posts/{post_id}/thumbnail?size={size}&v={version or 'new'}&sig={self.signature(post_id)}"
+
+    # Rendering
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+        return self._pool
+
+    async def generate(self, post: Dict) -> Optional[Dict]:
+        """Render and store derivatives for a post's inline image; reuses existing ones for the same image"""
+        invalid = None
+        try:
+            payload = inline_image_base64(post)
+        except ValueError as error:
+            # Stored as failed like an image Pillow can't decode, versioned by the stored value
+            payload, invalid = post.get("image_url") or post.get("image_data"), error
+        if not payload:
+            return None
+
+        pending = self._inflight.get(post["_id"])
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[post["_id"]] = future
+        try:
+            version = hashlib.sha256(payload.encode("utf-8", "surrogatepass")).hexdigest()[:16]
+            existing = await self.collection.find_one({"_id": post["_id"], "version": version})
+            if existing:
+                future.set_result(existing)
+                return existing
+
+            document = {
+                "_id": post["_id"],
+                "user_id": post["user_id"],
+                "version": version,
+                "created_at": datetime.utcnow().isoformat(),
+            }
+            try:
+                if invalid is not None:
+                    raise invalid
+                image_bytes = base64.b64decode(payload)
+                derivatives = await asyncio.get_running_loop().run_in_executor(self._executor(), _render_derivatives, image_bytes)
+            except BrokenExecutor:
+                raise  # Not the image's fault; retried on the next request
+            except Exception as error:
+                # Undecodable or corrupt image (binascii / Pillow errors)
+                document["failed"] = f"{type(error).__name__}: {error}"[:200]
+            else:
+                document["images"] = {
+                    size: {
+                        "width": rendered["width"],
+                        "height": rendered["height"],
+                        **{fmt: Binary(rendered[fmt]) for fmt in THUMBNAIL_FORMATS},
+                    }
+                    for size, rendered in derivatives.items()
+                }
+            await self.collection.replace_one({"_id": post["_id"]}, document, upsert=True)
+            await self.posts.update_one({"_id": post["_id"]}, {"$set": {"thumbnail_version": version}})
+            future.set_result(document)
+            return document
+        except Exception as error:
+            future.set_exception(error)
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(post["_id"], None)
+
+    def schedule(self, post: Dict):
+        """Generate derivatives in the background after a post with an inline image is saved"""
+        try:
+            if not inline_image_base64(post):
+                return
+        except ValueError:
+            pass  # Recorded as a failed render
+        task = asyncio.create_task(self.generate(post))
+        self._tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        # A failed background render is retried on demand by get(); don't leak the exception
+        if not task.cancelled():
+            task.exception()
+
+    # Serving
+
+    def _remember(self, key: Tuple[str, str, str, str], data: bytes):
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > THUMBNAIL_MEMORY_CACHE_BYTES and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    async def get(self, post_id: str, size: str, fmt: str) -> Optional[Tuple[bytes, str]]:
+        """Return (image bytes, version), rendering on demand for posts that predate the pipeline"""
+        document = await self.collection.find_one({"_id": post_id}, {"version": 1, "failed": 1})
+        if document and document.get("failed"):
+            return None
+        if document:
+            key = (post_id, document["version"], size, fmt)
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                return cached, document["version"]
+            document = await self.collection.find_one({"_id": post_id}, {"version": 1, f"images.{size}.{fmt}": 1})
+
+        if not document:
+            projection = {"user_id": 1, "image_url": 1, "image_data": 1}
+            post = await self.posts.find_one({"_id": post_id}, projection)
+            if not post and self.archive is not None:
+                post = await self.archive.find(post_id, None, {**projection, "archived_images": 1})
+            if not post:
+                return None
+            document = await self.generate(post)
+            if not document or document.get("failed"):
+                return None
+
+        data = bytes(document["images"][size][fmt])
+        self._remember((post_id, document["version"], size, fmt), data)
+        return data, document["version"]
+
+    async def delete(self, post_id: str):
+        await self.collection.delete_one({"_id": post_id})
+
+    async def delete_many(self, post_ids: List[str]):
+        """Drop stored derivatives; posts that still have an inline image are re-rendered on demand by get()"""
+        if post_ids:
+            await self.collection.delete_many({"_id": {"$in": post_ids}})
+
+    def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
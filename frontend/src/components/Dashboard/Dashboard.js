@@ -8,6 +8,7 @@ import PinterestConnect from '../Pinterest/PinterestConnect';
 function Dashboard() {
   const navigate = useNavigate();
   const [posts, setPosts] = useState([]);
+  const [analytics, setAnalytics] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [filter, setFilter] = useState('all');
@@ -15,9 +16,71 @@ function Dashboard() {
 
   useEffect(() => {
     fetchPosts();
+    fetchAnalytics();
     checkPinterestConnection();
   }, []);
 
+  // Live status updates (e.g. scheduled -> published) instead of re-fetching the list
+  useEffect(() => {
+    if (!localStorage.getItem('token') || typeof EventSource === 'undefined') return undefined;
+
+    let events = null;
+    let retryTimer = null;
+    let closed = false;
+    const parse = (event) => JSON.parse(event.data);
+
+    // The stream URL carries a short-lived token (EventSource can't send headers), so a
+    // dropped connection is reopened with a fresh one rather than by the browser's retry
+    const connect = async () => {
+      let streamToken;
+      try {
+        const response = await api.post('/events/token');
+        streamToken = response.data.token;
+      } catch (err) {
+        retryTimer = setTimeout(connect, 10000);
+        return;
+      }
+      if (closed) return;
+
+      events = new EventSource(`/api/events/posts?token=${encodeURIComponent(streamToken)}`);
+      events.addEventListener('post.updated', (event) => {
+        const { post } = parse(event);
+        setPosts((current) => current.map((item) => (item._id === post._id ? { ...item, ...post } : item)));
+        fetchAnalytics();
+      });
+      events.addEventListener('post.deleted', (event) => {
+        const { post } = parse(event);
+        setPosts((current) => current.filter((item) => item._id !== post._id));
+        fetchAnalytics();
+      });
+      events.addEventListener('post.created', () => {
+        fetchPosts();
+        fetchAnalytics();
+      });
+      events.addEventListener('post.resync', () => {
+        fetchPosts();
+        fetchAnalytics();
+      });
+      events.onerror = () => {
+        events.close();
+        if (!closed) {
+          // Events may have been missed while disconnected
+          retryTimer = setTimeout(() => {
+            fetchPosts();
+            connect();
+          }, 3000);
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (events) events.close();
+    };
+  }, []);
+
   const checkPinterestConnection = () => {
     const user = localStorage.getItem('user');
     if (user) {
@@ -41,12 +104,23 @@ function Dashboard() {
     }
   };
 
+  const fetchAnalytics = async () => {
+    try {
+      const response = await api.get('/analytics/dashboard');
+      setAnalytics(response.data);
+    } catch (err) {
+      // Fall back to counting the loaded posts
+      setAnalytics(null);
+    }
+  };
+
   const handleDelete = async (postId) => {
     if (!window.confirm('Are you sure you want to delete this post?')) return;
 
     try {
       await api.delete(`/posts/${postId}`);
       setPosts(posts.filter((post) => post._id !== postId));
+      fetchAnalytics();
     } catch (err) {
       alert('Failed to delete post');
     }
@@ -76,6 +150,14 @@ function Dashboard() {
   });
 
   const getStats = () => {
+    if (analytics) {
+      return {
+        total: analytics.total,
+        draft: analytics.draft,
+        scheduled: analytics.scheduled,
+        published: analytics.published,
+      };
+    }
     return {
       total: posts.length,
       draft: posts.filter(p => p.status === 'draft').length,
@@ -222,10 +304,11 @@ function Dashboard() {
               >
                 {/* Image */}
                 <div className="relative h-56 bg-gradient-to-br from-gray-100 to-gray-200 flex items-center justify-center overflow-hidden">
-                  {post.image_url ? (
+                  {post.thumbnail_url || post.image_url ? (
                     <img
-                      src={post.image_url}
+                      src={post.thumbnail_url || post.image_url}
                       alt="Post"
+                      loading="lazy"
                       className="w-full h-full object-cover transition transform hover:scale-110"
                     />
                   ) : (
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback, useMemo } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useNavigate, useSearchParams } from 'react-router-dom';
 import { Sparkles, Image as ImageIcon, Calendar, Save, Send, Loader2, Hash, Upload } from 'lucide-react';
 import api from '../../services/api';
@@ -49,6 +49,25 @@ function PostCreator() {
   const [pinterestConnected, setPinterestConnected] = useState(false);
   const [postingToPinterest, setPostingToPinterest] = useState(false);
 
+  // One Idempotency-Key per submission attempt and operation (create, publish). A request that
+  // got no response (timeout, dropped connection) keeps its key, so resubmitting the same body
+  // returns the first result instead of creating a second post or pin; any response ends the attempt
+  const attemptKeys = useRef({});
+  const idempotent = (operation, body) => {
+    const fingerprint = JSON.stringify(body);
+    let attempt = attemptKeys.current[operation];
+    if (!attempt || attempt.fingerprint !== fingerprint) {
+      const key = window.crypto?.randomUUID ? window.crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+      attempt = attemptKeys.current[operation] = { fingerprint, key };
+    }
+    return { headers: { 'Idempotency-Key': attempt.key } };
+  };
+  const endAttempt = (operation, err) => {
+    if (!err || err.response) {
+      delete attemptKeys.current[operation];
+    }
+  };
+
   // Check Pinterest connection on mount only
   useEffect(() => {
     const user = localStorage.getItem('user');
@@ -254,11 +273,13 @@ function PostCreator() {
         await api.put(`/posts/${editId}`, formData);
         setSuccess('Post updated successfully!');
       } else {
-        await api.post('/posts', {
+        const newPost = {
           ...formData,
           ai_generated_caption: !!aiSettings.topic,
           ai_generated_image: !!imagePrompt,
-        });
+        };
+        await api.post('/posts', newPost, idempotent('create', newPost));
+        endAttempt('create');
         setSuccess('Post saved as draft!');
       }
 
@@ -266,6 +287,7 @@ function PostCreator() {
         navigate('/dashboard');
       }, 1500);
     } catch (err) {
+      endAttempt('create', err);
       setError(err.response?.data?.detail || 'Failed to save post');
     } finally {
       setLoading(false);
@@ -290,11 +312,13 @@ function PostCreator() {
       if (editId) {
         await api.put(`/posts/${editId}`, formData);
       } else {
-        await api.post('/posts', {
+        const newPost = {
           ...formData,
           ai_generated_caption: !!aiSettings.topic,
           ai_generated_image: !!imagePrompt,
-        });
+        };
+        await api.post('/posts', newPost, idempotent('create', newPost));
+        endAttempt('create');
       }
 
       setSuccess('Post scheduled successfully!');
@@ -302,6 +326,7 @@ function PostCreator() {
         navigate('/dashboard');
       }, 1500);
     } catch (err) {
+      endAttempt('create', err);
       setError(err.response?.data?.detail || 'Failed to schedule post');
     } finally {
       setLoading(false);
@@ -332,20 +357,26 @@ function PostCreator() {
     setPostingToPinterest(true);
     setError('');
 
+    let operation;
     try {
       let postId = editId;
       if (!editId) {
-        const saveResponse = await api.post('/posts', {
+        const newPost = {
           ...formData,
           ai_generated_caption: !!aiSettings.topic,
           ai_generated_image: !!imagePrompt,
-        });
+        };
+        operation = 'create';
+        const saveResponse = await api.post('/posts', newPost, idempotent(operation, newPost));
         postId = saveResponse.data.post._id;
       }
 
-      const response = await api.post(`/pinterest/post/${postId}`, {
-        board_ids: selectedBoards
-      });
+      // The create attempt stays open until the publish is done, so retrying a failed publish reuses the post
+      const publish = { board_ids: selectedBoards };
+      operation = `publish:${postId}`;
+      const response = await api.post(`/pinterest/post/${postId}`, publish, idempotent(operation, publish));
+      endAttempt('create');
+      endAttempt(operation);
 
       if (response.data.success) {
         setSuccess(`Posted to Pinterest successfully! ${response.data.is_mock ? '(Mock Mode)' : ''}`);
@@ -354,6 +385,7 @@ function PostCreator() {
         }, 2000);
       }
     } catch (err) {
+      endAttempt(operation, err);
       setError(err.response?.data?.detail || 'Failed to post to Pinterest');
     } finally {
       setPostingToPinterest(false);